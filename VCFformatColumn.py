@@ -1,5 +1,9 @@
 import os
+import json
+import multiprocessing
 from datetime import datetime
+from itertools import islice
+import vcf
 
 version = 1
 '''
@@ -16,11 +20,47 @@ version = 1
     Input arguments:
         filename:       the name of the file we want to parse
         formatColumn:   the number of the FORMAT column. The numbering is zero-based
-        subColumnToGet: the part of the FORMAT column that we want to extract (e.g. "GT")
+        subColumnToGet: the part of the FORMAT column that we want to extract (e.g. "GT"). 
+                        It can also be a list of parts (e.g. ["GT","AD","DP"]) or a string with
+                        the parts separated by commas (e.g. "GT,AD,DP"), in which case all of
+                        them are extracted reading the file only once
+        combined:       (default False) if more than one parts are extracted, False writes one 
+                        output file for each part, while True writes a single output file where
+                        the FORMAT column becomes the extracted parts (e.g. "GT:AD:DP") and each
+                        sample column keeps only these parts (e.g. "0:4,0:4")
+        workers:        (default 1) the number of processes used. With more than one worker, chunks
+                        of lines are processed in parallel and written in their original order
+        chunksize:      (default 10000) the number of lines in each chunk given to a worker
+        matrix:         (default False) if True, instead of a text file, each part is written as a
+                        NumPy array (see 'extractMatrix' below), ready to be memory-mapped by 
+                        'loadMatrix'. 'combined' and 'workers' are not used in this case
+        ploidy:         (default 2) used only with matrix=True (see 'extractMatrix')
 
     Output:
-        The output of the script is a new file (filename + "_out") containing the lines
-        of the filename with sample columns replaced
+        The output of the script is a new file (filename + "_" + subColumnToGet + "extract") 
+        containing the lines of the filename with sample columns replaced (one file for each 
+        part, or one file named with all the parts if combined=True). A part that is missing
+        from the FORMAT column of a line (or from a sample) is written as "."
+
+    Binary output (extractMatrix / loadMatrix):
+        extractMatrix(filename, formatColumn=8, subColumnToGet="AD", ploidy=2, chunksize=10000)
+        writes each part as a typed NumPy array of (sites x samples) or (sites x samples x width)
+        values, in a file (filename + "_" + subColumnToGet + "extract.npy"). The type comes from
+        the ##FORMAT line of the header (or the standard type of the part): Integer parts are
+        written as int32 with -1 for missing, Float parts as float32 with NaN for missing and GT 
+        as int8 allele codes (sites x samples x ploidy, -1 for missing). Parts with more than one
+        value get a fixed width from their Number: R (e.g. AD) the maximum number of alleles of
+        the file, A one less, G (e.g. PL) the number of genotypes for 'ploidy' (n(n+1)/2 for 
+        diploids), while '.' uses the maximum number of values found. Missing values are padded.
+        The CHROM and POS of the sites and the names of the samples are written in a small sidecar
+        (filename + "_extract.json" and filename + "_POSextract.npy").
+        loadMatrix(filename, subColumnToGet) returns a dictionary with the 'samples', 'CHROM', 'POS'
+        and the arrays of the parts (memory-mapped, so they are not read into memory)
+        NumPy is needed only for these functions.
+        Example:
+        >>> VCFformatColumn.extractMatrix("cohort_225.vcf", 8, "GT,AD,DP")
+        >>> m = VCFformatColumn.loadMatrix("cohort_225.vcf", "AD")
+        >>> m['AD'][:, m['samples'].index('S1'), 0]    <--- reference allele depths of sample S1
 
     ------ find_length.py use --------------------------
     >>> import os
@@ -36,7 +76,7 @@ version = 1
     >>> VCFformatColumn.extract()
 '''
 
-def extract(filename="cohort_225.vcf", formatColumn= 8, subColumnToGet="GT"):
+def extract(filename="cohort_225.vcf", formatColumn= 8, subColumnToGet="GT", combined=False, workers=1, chunksize=10000, matrix=False, ploidy=2):
     #check for input files
     curPath=os.getcwd()+os.path.sep
     if filename=="":
@@ -47,54 +87,345 @@ def extract(filename="cohort_225.vcf", formatColumn= 8, subColumnToGet="GT"):
 
     # check if subColumnToGet is empty
     if subColumnToGet=="":
-        filename=input("Please enter the type (GT/AD/DP/GQ/PL): ")
+        subColumnToGet=input("Please enter the type (GT/AD/DP/GQ/PL): ")
     if subColumnToGet=="":
         print("Type not entered. Aborting...")
         return
+    # the list of the sub-columns to extract
+    if isinstance(subColumnToGet,str):
+        subColumns=[sub.strip() for sub in subColumnToGet.split(',') if sub.strip()!=""]
+    else:
+        subColumns=list(subColumnToGet)
+    if matrix:
+        extractMatrix(filename,formatColumn,subColumns,ploidy,chunksize)
+        return
 
-    # we also create the output file, overwriting it if exists
-    if filename.endswith(".vcf"):
-        filenameout=filename.replace(".vcf","")+"_"+subColumnToGet+"extract.vcf"
+    # we also create the output file(s), overwriting them if exist
+    if combined:
+        outputs=[(subColumns,open(curPath+outputName(filename,"_".join(subColumns)),"w"))]
     else:
-        filenameout=filename+"_"+subColumnToGet+"extract"
-    fout = open(curPath+filenameout,"w")
+        outputs=[([sub],open(curPath+outputName(filename,sub),"w")) for sub in subColumns]
     # start time counter (just to have an idea of running time)
     start_time = datetime.now()
+    groups=[subs for subs,fout in outputs]
     #open file and start iterate
     linenum=0
     with open(curPath+filename,'r') as fp:
-        for line in fp:
-            linenum +=1
-            if(line.startswith('#')): #keep lines starting with '#' as they are 
-                fout.write(line.strip()+'\n')
-            else: # really process the rest of lines
-                li = line.strip().split('\t')
-                if(len(li)>formatColumn):
-                    # from formatColumn argument find the index of the sub-column we want to extract from each sample
-                    formatToExtract = li[formatColumn].split(':')
-                    indexToExtract=0
-                    for j in range(len(formatToExtract)):
-                        if formatToExtract[j]==subColumnToGet:
-                            indexToExtract=j
-                            break
-                    #in each sample column find the proper sub-column and replace the relevant li[i] with it
-                    for i in range(formatColumn+1,len(li)):
-                        sss = li[i].split(':')
-                        li[i] = sss[indexToExtract]
-                    
-                    #write the line to the output file with the replaced sample data 
-                    new_line='\t'.join(li)
-                    fout.write(new_line+"\n")
-                else: 
-                    # in case we have no more columns than the FORMAT column then add "---->" at the begining 
-                    # of line, just to unknowledge
-                    fout.write("---->"+line.strip()+"\n")
-    fout.close()
+        tasks=((chunk,formatColumn,groups) for chunk in readChunks(fp,chunksize))
+        if workers<=1:
+            results=map(extractChunk,tasks)
+            linenum=writeChunks(results,outputs)
+        else:
+            # the chunks are processed in parallel, but returned in the order of the file. At most
+            # workers*2 chunks are read ahead of the written ones, so the file is not read into memory
+            with multiprocessing.Pool(workers) as pool:
+                linenum=writeChunks(vcf.imapBounded(pool,extractChunk,tasks,workers*2),outputs)
+    for subs,fout in outputs:
+        fout.close()
     # calculate the running time
     ms=gettimediff(start_time)
     # print some messages to the user
     print("Extracted {} lines in {} sec".format(linenum, ms/1000))
 
+# Function that yields the lines of the open file 'fp' in lists of 'chunksize' lines
+def readChunks(fp, chunksize):
+    while True:
+        chunk=list(islice(fp,chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+# Function that writes the results of 'extractChunk' to the output files, returning the number of lines
+def writeChunks(results, outputs):
+    linenum=0
+    for num,texts in results:
+        linenum +=num
+        for text,(subs,fout) in zip(texts,outputs):
+            fout.write(text)
+    return linenum
+
+# Function that processes a chunk of lines for 'extract'. It is given a tuple (lines, formatColumn, groups)
+# so that it can be used by a multiprocessing pool, and returns the number of lines and the text to be 
+# written to each output file
+def extractChunk(args):
+    lines,formatColumn,groups=args
+    # FORMAT string -> indexes of the sub-columns, kept for the chunk only (files have only a few FORMATs,
+    # so each one is split once per chunk and nothing is kept between the runs of 'extract')
+    layouts={}
+    outs=[[] for subs in groups]
+    for line in lines:
+        if(line.startswith('#')): #keep lines starting with '#' as they are 
+            for out in outs:
+                out.append(line.strip())
+        else: # really process the rest of lines
+            new_lines=extractLine(line,formatColumn,groups,layouts)
+            if new_lines is not None:
+                # the line with the replaced sample data for each output file
+                for new_line,out in zip(new_lines,outs):
+                    out.append(new_line)
+            else: 
+                # in case we have no more columns than the FORMAT column then add "---->" at the begining 
+                # of line, just to unknowledge
+                for out in outs:
+                    out.append("---->"+line.strip())
+    return len(lines),[''.join([l+'\n' for l in out]) for out in outs]
+
+# Function that returns, for a data line, the new line for each group of sub-columns in 'groups'
+# (or None if the line has no sample columns). 'layouts' caches the indexes of the sub-columns for
+# each FORMAT string. A sub-column that is absent from the FORMAT (or from a sample, as trailing
+# sub-columns may be dropped) is given as '.'
+def extractLine(line, formatColumn, groups, layouts):
+    li = line.strip().split('\t')
+    if(len(li)<=formatColumn):
+        return None
+    form=li[formatColumn]
+    layout=layouts.get(form)
+    if layout is None:
+        formatToExtract=form.split(':')
+        layout=[]
+        for subs in groups:
+            layout.append([formatToExtract.index(sub) if sub in formatToExtract else None for sub in subs])
+        layouts[form]=layout
+    start=li[:formatColumn]
+    cells=li[formatColumn+1:]
+    if len(layout)==1 and len(layout[0])==1:
+        # only one sub-column needed: split each sample only up to it instead of splitting the whole sample
+        k=layout[0][0]
+        if k is None:
+            return ['\t'.join(start+[form]+['.']*len(cells))]
+        samples=[cell.split(':',k+1) for cell in cells]
+        return ['\t'.join(start+[form]+[sss[k] if k<len(sss) else '.' for sss in samples])]
+    # split each sample column once, for all the sub-columns
+    samples=[cell.split(':') for cell in cells]
+    new_lines=[]
+    for subs,ks in zip(groups,layout):
+        if len(ks)==1:
+            k=ks[0]
+            newcols=[sss[k] if k is not None and k<len(sss) else '.' for sss in samples]
+            newform=form
+        else:
+            newcols=[':'.join([sss[k] if k is not None and k<len(sss) else '.' for k in ks]) for sss in samples]
+            newform=':'.join(subs)
+        new_lines.append('\t'.join(start+[newform]+newcols))
+    return new_lines
+
+# Function that returns the name of the output file for the extracted 'subColumn'
+def outputName(filename, subColumn):
+    if filename.endswith(".vcf"):
+        return filename.replace(".vcf","")+"_"+subColumn+"extract.vcf"
+    return filename+"_"+subColumn+"extract"
+
+
+###############################################################################
+###                     binary (NumPy) output                               ###
+###############################################################################
+# the Number of the standard FORMAT parts, used when the header has no ##FORMAT line for them
+formatNumbers={'AD':'R', 'ADF':'R', 'ADR':'R', 'EC':'A', 'GL':'G', 'GP':'G', 'PL':'G'}
+
+# Function that writes the parts 'subColumnToGet' of the samples as NumPy arrays (see the docstring above)
+def extractMatrix(filename="cohort_225.vcf", formatColumn= 8, subColumnToGet="AD", ploidy=2, chunksize=10000):
+    import numpy as np
+    curPath=os.getcwd()+os.path.sep
+    if not os.path.exists(curPath+filename):
+        print("File {} not found in currently working directory. Aborting...".format(filename))
+        return
+    if isinstance(subColumnToGet,str):
+        subColumns=[sub.strip() for sub in subColumnToGet.split(',') if sub.strip()!=""]
+    else:
+        subColumns=list(subColumnToGet)
+    start_time = datetime.now()
+    header=vcf.readHeader(curPath+filename)
+    samples=header.fields[formatColumn+1:]
+    types={}
+    for sub in subColumns:
+        typ,number=matrixType(header,sub)
+        if typ=='String' and sub!='GT':
+            print("Part {} is not numeric (Type=String). Aborting...".format(sub))
+            return
+        types[sub]=(typ,number)
+    # first pass: count the sites and the alleles (and the values of the parts with Number '.')
+    sites,alleles,counts=matrixShape(curPath+filename,formatColumn,subColumns,types)
+    if sites>0 and not samples: # no header line: the samples are those of the data lines
+        samples=["sample"+str(i+1) for i in range(counts['samples'])]
+    arrays={}
+    specs={}
+    for sub in subColumns:
+        typ,number=types[sub]
+        width=matrixWidth(number,alleles,ploidy,counts.get(sub,1))
+        if sub=='GT':
+            dtype,missing,width=np.int8,-1,ploidy
+        elif typ=='Float':
+            dtype,missing=np.float32,np.nan
+        else:
+            dtype,missing=np.int32,-1
+        shape=(sites,len(samples),width) if width>1 or sub=='GT' else (sites,len(samples))
+        name=matrixName(filename,sub)
+        arrays[sub]=np.lib.format.open_memmap(curPath+name,mode='w+',dtype=dtype,shape=shape)
+        arrays[sub][:]=missing
+        specs[sub]={'file':name, 'dtype':np.dtype(dtype).name, 'shape':list(shape), 'number':number}
+    # second pass: fill the arrays, 'chunksize' sites at a time
+    layouts={}
+    pos=np.zeros(sites,dtype=np.int64)
+    chroms=[]  # [CHROM, first site, number of sites] for each run of sites of the same CHROM
+    row=0
+    with open(curPath+filename,'r') as fp:
+        for chunk in readChunks(fp,chunksize):
+            rows=[]
+            for line in chunk:
+                if line.startswith('#'):
+                    continue
+                li=line.rstrip('\r\n').split('\t')
+                if len(li)<=formatColumn:
+                    continue
+                if chroms and chroms[-1][0]==li[0]:
+                    chroms[-1][2] +=1
+                else:
+                    chroms.append([li[0],row+len(rows),1])
+                pos[row+len(rows)]=int(li[1])
+                rows.append(li)
+            if rows:
+                for sub in subColumns:
+                    fillMatrix(np,arrays[sub],row,rows,formatColumn,sub,layouts)
+                row +=len(rows)
+    for sub in subColumns:
+        arrays[sub].flush()
+    np.save(curPath+matrixName(filename,'POS'),pos)
+    side={'file':filename, 'samples':samples, 'chroms':chroms, 'ploidy':ploidy, 'parts':specs}
+    with open(curPath+sidecarName(filename),'w') as fo:
+        json.dump(side,fo)
+    ms=gettimediff(start_time)
+    print("Extracted {} sites of {} samples in {} sec".format(sites, len(samples), ms/1000))
+
+# Function that reads the arrays written by 'extractMatrix' (memory-mapped). Returns a dictionary with
+# the 'samples', 'CHROM', 'POS' and the array of each part in 'subColumnToGet' (all parts if None)
+def loadMatrix(filename="cohort_225.vcf", subColumnToGet=None):
+    import numpy as np
+    curPath=os.getcwd()+os.path.sep
+    if not os.path.exists(curPath+sidecarName(filename)):
+        print("File {} not found in currently working directory. Aborting...".format(sidecarName(filename)))
+        return None
+    with open(curPath+sidecarName(filename),'r') as fi:
+        side=json.load(fi)
+    if subColumnToGet is None:
+        subColumns=list(side['parts'])
+    elif isinstance(subColumnToGet,str):
+        subColumns=[sub.strip() for sub in subColumnToGet.split(',') if sub.strip()!=""]
+    else:
+        subColumns=list(subColumnToGet)
+    result={'samples':side['samples']}
+    result['POS']=np.load(curPath+matrixName(filename,'POS'),mmap_mode='r')
+    result['CHROM']=np.repeat(np.array([c[0] for c in side['chroms']]),[c[2] for c in side['chroms']])
+    for sub in subColumns:
+        if sub not in side['parts']:
+            print("Part {} was not extracted in {}".format(sub,sidecarName(filename)))
+            continue
+        result[sub]=np.load(curPath+side['parts'][sub]['file'],mmap_mode='r')
+    return result
+
+# Function that returns the (Type, Number) of a FORMAT part, from the header or the standard parts
+def matrixType(header, sub):
+    for form in header.form:
+        if form.get('ID')==sub:
+            return form.get('Type','String'),form.get('Number','1')
+    desc=vcf.vcf_format.get(sub,'(Integer)')
+    return desc[desc.rfind('(')+1:-1],formatNumbers.get(sub,'1')
+
+# Function that counts the sites of the file, the maximum number of alleles and, for the parts with
+# Number '.', the maximum number of values in a sample
+def matrixShape(file, formatColumn, subColumns, types):
+    sites=0
+    alleles=1
+    counts={'samples':0}
+    free=[sub for sub in subColumns if types[sub][1]=='.']
+    layouts={}
+    with open(file,'r') as fp:
+        for line in fp:
+            if line.startswith('#') or line.count('\t')<formatColumn:
+                continue
+            sites +=1
+            alt=line.split('\t',5)[4]
+            if alt.count(',')+2>alleles:
+                alleles=alt.count(',')+2
+            if sites==1 or free:
+                li=line.rstrip('\r\n').split('\t')
+                counts['samples']=max(counts['samples'],len(li)-formatColumn-1)
+                for sub in free:
+                    k=formatIndex(li[formatColumn],sub,layouts)
+                    if k is None:
+                        continue
+                    for cell in li[formatColumn+1:]:
+                        sss=cell.split(':',k+1)
+                        if k<len(sss):
+                            counts[sub]=max(counts.get(sub,1),sss[k].count(',')+1)
+    return sites,alleles,counts
+
+# Function that returns the number of values for a part with 'number' (the Number of the header)
+def matrixWidth(number, alleles, ploidy, count):
+    if number=='R':
+        return alleles
+    if number=='A':
+        return max(alleles-1,1)
+    if number=='G': # number of (unordered) genotypes of 'ploidy' alleles among 'alleles'
+        width=1
+        for i in range(ploidy):
+            width=width*(alleles+i)//(i+1)
+        return width
+    if number=='.':
+        return count
+    return int(number) if number.isdigit() and int(number)>0 else 1
+
+# Function that returns the (cached) index of 'sub' in a FORMAT string (None if missing)
+def formatIndex(form, sub, layouts):
+    key=(form,sub)
+    if key not in layouts:
+        formatToExtract=form.split(':')
+        layouts[key]=formatToExtract.index(sub) if sub in formatToExtract else None
+    return layouts[key]
+
+# Function that fills the rows 'row'... of 'array' with the part 'sub' of the split data lines 'rows'
+def fillMatrix(np, array, row, rows, formatColumn, sub, layouts):
+    ns=array.shape[1]
+    width=array.shape[2] if array.ndim==3 else 1
+    missing='-1' if array.dtype.kind=='i' else 'nan'
+    text=[]
+    for li in rows:
+        k=formatIndex(li[formatColumn],sub,layouts)
+        cells=li[formatColumn+1:formatColumn+1+ns]
+        if k is None:
+            text.extend(['.']*(ns*width))
+            continue
+        if len(cells)<ns:
+            cells=cells+['.']*(ns-len(cells))
+        sep='/' if sub=='GT' else ','
+        for cell in cells:
+            sss=cell.split(':',k+1)
+            value=sss[k] if k<len(sss) else '.'
+            if width==1:
+                text.append(value)
+                continue
+            if sub=='GT' and '|' in value:
+                value=value.replace('|','/')
+            values=value.split(sep,width)
+            if len(values)==width:
+                text.extend(values)
+            elif len(values)<width:
+                text.extend(values+['.']*(width-len(values)))
+            else:
+                text.extend(values[:width])
+    block=np.array(text,dtype=str)
+    block=np.where((block=='.')|(block==''),missing,block)
+    block=block.astype(array.dtype).reshape((len(rows),)+array.shape[1:])
+    array[row:row+len(rows)]=block
+
+# Functions that return the names of the files written by 'extractMatrix'
+def matrixName(filename, subColumn):
+    name=outputName(filename,subColumn)
+    if name.endswith(".vcf"):
+        name=name[:-4]
+    return name+".npy"
+
+def sidecarName(filename):
+    return matrixName(filename,"")[:-4]+".json"
 
 
 # Function to calculate time difference (in miliseconds)
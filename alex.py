@@ -5,9 +5,11 @@
     @author: cooknas (cooknas@gmail.com)
 
     This is a library that contains the following Methods/Functions:
-    - changefiledata(filein="", fileout="", stdcols=9, log_console=False, markchanges=True)
-    - filterdata(argin="", argout="", max_gene=54)
+    - changefiledata(filein="", fileout="", stdcols=9, log_console=False, markchanges=True, workers=1)
+    - filterdata(argin="", argout="", max_gene=54, workers=1, verbose=False, progress=10, logfile="", summary=False, unsorted=False)
     - readVCFdata(file)
+    - iterVCFdata(file)
+    - openVCFfile(file, useindex=True)
     - gethelp(method)
     - create_gene_file(gene_file="gene_file.txt", datapath_in="data_in", datapath_out="data_out")
     - ...more to come
@@ -58,12 +60,12 @@ vcf_format = {'AD' : 'Read depth for each allele (Integer)',
     #  0    1   2  3   4    5    6      7    8
     #CHROM POS ID REF ALT QUAL FILTER INFO FORMAT
 
-    Reads a text file and for each line where reference column differs from
-    the Info column (after 'AA='):
-        -changes the Info value ,
-        -interchange REF and ALT columns,
-        -changes DT format value from 1 to 0 or from 0 to 1 and
+    Reads a VCF file and for each line where reference column differs from
+    the Info column (after 'AA='), if it is one of the ALT alleles:
+        -interchange REF and this ALT allele (multiallelic lines too),
+        -changes GT format value from 1 to 0 or from 0 to 1 (k and 0 for the k-th ALT) and
         -interchanges values inside AD and PL columns of samples format.
+    The Info value (AA=) is kept, as it is now the REF.
 
     Arguments:
     filein:  the filename of the data file from where data is read. If it is
@@ -75,10 +77,12 @@ vcf_format = {'AD' : 'Read depth for each allele (Integer)',
     log_console (default=False): if the script must write infos on console
     markchanges (default=True):  if True then in each changed line an asterisk (*)
                                  is added at the start of the line
+    workers (default=1): the number of processes that change the lines (in chunks),
+                         the lines are written in their original order
 '''
-def changefiledata(filein="", fileout="", stdcols=9, log_console=False, markchanges=True):
+def changefiledata(filein="", fileout="", stdcols=9, log_console=False, markchanges=True, workers=1):
     import changefiledata
-    changefiledata.changefiledata(filein, fileout, stdcols, log_console, markchanges)
+    changefiledata.changefiledata(filein, fileout, stdcols, log_console, markchanges, workers)
 
 ###############################################################################
 ###                             filterdata                                  ###
@@ -96,11 +100,27 @@ def changefiledata(filein="", fileout="", stdcols=9, log_console=False, markchan
                     'max_gene' (optional) it has a predefined value 
                             of 4 (or any other value) and is telling 
                             how many are the different types of 
-                            genes we have in our file'''
+                            genes we have in our file
+                    'workers' (optional) the number of processes that filter
+                            the data (default 1). The file is split in parts
+                            at the block boundaries, filtered in parallel and 
+                            the outputs are written in order
+                    'verbose' (optional) if True a message is printed for 
+                            each block (default False)
+                    'progress' (optional) the interval in seconds of the 
+                            progress messages (default 10, 0 for none)
+                    'logfile' (optional) a file for the message of each block
+                    'summary' (optional) if True the result is printed as 
+                            a JSON line (default False)
+                    'unsorted' (optional) if True the lines of each gene need
+                            not be together in the file, they are grouped
+                            first by an external sort (default False)
+         It returns a dictionary with the metrics of the run (lines, blocks 
+         and lines written and dropped, bytes read, seconds, lines per second)'''
 
-def filterdata(argin="", argout="", max_gene=54):
+def filterdata(argin="", argout="", max_gene=54, workers=1, verbose=False, progress=10, logfile="", summary=False, unsorted=False):
     import filterdata
-    filterdata.filterdata(argin, argout, max_gene)
+    return filterdata.filterdata(argin, argout, max_gene, workers, verbose, progress, logfile, summary, unsorted)
 
 ##################################################################################################
 ###                                    create_gene_file                                        ###
@@ -143,7 +163,19 @@ def create_gene_file(gene_file="gene_file.txt", datapath_in="data_in", datapath_
     fields,meta,info,filter,format,data,fileformat = alex.readVCFdata('some_file_name.txt', getdata=True)
 '''  
 def readVCFdata(file, getdata=True):
-    vcf.read(file,getdata)
+    return vcf.read(file,getdata)
+
+''' Function iterVCFdata
+    input:  file, the name of a file to read the data from
+    output: a generator that yields the data lines (as dictionaries) one by one
+
+    Same data as 'readVCFdata' returns, but one line at a time, for big files
+    *************************** example ****************************
+    for dic in alex.iterVCFdata('some_file_name.txt'):
+        print(dic['CHROM'],dic['POS'])
+'''
+def iterVCFdata(file):
+    return vcf.iterRecords(file)
 
 def getFields(file):
     return vcf.getFields(file)
@@ -160,8 +192,8 @@ def getFilter(file):
 def getFormat(file):
     return vcf.getFormat(file)
 
-def getData(file,startLine=0,num_of_lines=1):
-    return vcf.getFile(file, startLine, num_of_lines)
+def getData(file,startLine=0,num_of_lines=1,useindex=False):
+    return vcf.getData(file, startLine, num_of_lines, useindex)
 
 def getFirstDataline(file):
     return vcf.getFirstDataline(file)
@@ -169,11 +201,14 @@ def getFirstDataline(file):
 def getFileformat(file):
     return vcf.getFileformat(file)
 
-def printSampleData(file, lineNo):
-    vcf.printSampleData(file, lineNo)
+def printSampleData(file, lineNo, useindex=False):
+    vcf.printSampleData(file, lineNo, useindex)
 
-def getSampleData(file, lineNo):
-    return vcf.getSampleData(file, lineNo)
+def getSampleData(file, lineNo, useindex=False):
+    return vcf.getSampleData(file, lineNo, useindex)
+
+def openVCFfile(file, useindex=True):
+    return vcf.VCFFile(file, useindex)
 
 
 ###############################################################################
@@ -186,15 +221,15 @@ def getSampleData(file, lineNo):
 
 def gethelp(method):
     if method=="changefiledata":
-        print("Reads a text file and for each line where reference column ")
-        print("differs from the Info column (after 'AA='):")
-        print("   -changes the Info value,")
-        print("   -interchange REF and ALT columns,")
-        print("   -changes DT format value from 1 to 0 or from 0 to 1 and")
+        print("Reads a VCF file and for each line where reference column ")
+        print("differs from the Info column (after 'AA='), if it is one of")
+        print("the ALT alleles:")
+        print("   -interchange REF and this ALT allele,")
+        print("   -changes GT format value from 1 to 0 or from 0 to 1 and")
         print("   -interchanges values inside AD and PL columns of samples ")
         print("    format.")
         print("Syntax:")
-        print("changefiledata(filein, [fileout], [stdcols], [log_console], [markchanges])")
+        print("changefiledata(filein, [fileout], [stdcols], [log_console], [markchanges], [workers])")
         print("filein: the filename of the data file from where data is read.")
         print("        If it is not given then it asks for a filename")
         print("fileout: the output file where the anchanged and changed data") 
@@ -208,9 +243,11 @@ def gethelp(method):
         print("markchanges (default=True):  if True then in each changed line")
         print("                             an asterisk (*) is added at the ")
         print("                             start of the line")
+        print("workers (default=1): the number of processes that change the")
+        print("                     lines, written in their original order")
     elif method=="filterdata":
         print("A method for data filtering")
-        print("filterdata([file_in], [file_out], [max_gene])")
+        print("filterdata([file_in], [file_out], [max_gene], [workers], [verbose], [progress], [logfile], [summary], [unsorted])")
         print("     where:")      
         print("          'file_in'  (optional) is your txt data-file ")
         print("                     (must have extension '.txt')")
@@ -222,6 +259,18 @@ def gethelp(method):
         print("                     of 4 (or any other value) and is telling") 
         print("                     how many are the different types of") 
         print("                     genes we have in our file")
+        print("          'workers'  (optional) the number of processes that") 
+        print("                     filter the data (default 1)")
+        print("          'verbose'  (optional) if True a message is printed") 
+        print("                     for each block (default False)")
+        print("          'progress' (optional) the interval in seconds of the") 
+        print("                     progress messages (default 10, 0 for none)")
+        print("          'logfile'  (optional) a file for the message of each") 
+        print("                     block (default '' for none)")
+        print("          'summary'  (optional) if True the result is printed") 
+        print("                     as a JSON line (default False)")
+        print("          'unsorted' (optional) if True the lines of each gene") 
+        print("                     need not be together in the file (default False)")
     elif method=="readVCFdata":
         print("Function readVCFdata reads the data from an VCF file.")
         print("   input: the name of a file to read the data from")
@@ -234,6 +283,17 @@ def gethelp(method):
         print("")
         print("function call:") 
         print("fields,meta,info,filter,format,data = readVCFdata('some_file_name.txt')")
+    elif method=="iterVCFdata":
+        print("Function iterVCFdata reads the data lines of a VCF file one by one.")
+        print("   input: the name of a file to read the data from")
+        print("   output: a generator that yields a dictionary for each data line")
+        print("")
+        print("It yields the same dictionaries that readVCFdata returns in 'data',")
+        print("without keeping all of them in memory, so use it for big files.")
+        print("")
+        print("function call:")
+        print("for dic in iterVCFdata('some_file_name.txt'):")
+        print("    print(dic['CHROM'],dic['POS'])")
     elif method=="create_gene_file":
         print("The function that creates the gene-files. It actually imports the create_gene_file.py script")
         print("and then call internally the module: create_gene_file.main(gene_file, datapath_in, datapath_out)")
@@ -0,0 +1,196 @@
+import os
+import re
+from datetime import datetime
+import vcf
+
+version = 1
+'''
+    Problem description:
+    --------------------
+    standard columns (default=9) tab separated
+    #  0    1   2  3   4    5    6      7    8
+    #CHROM POS ID REF ALT QUAL FILTER INFO FORMAT
+
+    Reads a VCF file and for each line where reference column differs from
+    the ancestral allele of the Info column (after 'AA='), when the ancestral
+    allele is one of the ALT alleles (say the k-th one):
+        -interchanges REF and the k-th ALT allele,
+        -changes GT format value from k to 0 or from 0 to k (e.g. 0/1 -> 1/0),
+        -interchanges the values of REF and of the k-th ALT allele inside AD and
+         the genotype values inside PL columns of samples format (haploid or diploid).
+    The Info value (AA=) is not changed, as it is the ancestral allele which is now
+    the REF. Lines without AA, or with an AA that is not one of the alleles, are
+    written as they are.
+
+    Input arguments:
+        filein:      the filename of the data file from where data is read. If it is
+                     not given then it asks for a filename
+        fileout:     the output file where the anchanged and changed data will be written.
+                     If this argument is not given, the script uses the 'filein' adding
+                     '_out' keyword at the end of the name
+        stdcols:     (default=9) the count of standard columns after which the samples start
+        log_console: (default=False) if the script must write infos on console
+        markchanges: (default=True) if True then in each changed line an asterisk (*)
+                     is added at the start of the line
+        workers:     (default=1) the number of processes used. With more than one worker,
+                     chunks of lines are changed in parallel and written in their original order
+        chunkbytes:  (default=16MB) the (approximate) size in bytes of each chunk of lines
+    Output:
+        The output of the script is a new file (fileout) with the header of filein and its
+        data lines, changed where needed
+
+    ------ changefiledata.py use --------------------------
+    >>> import os
+    >>> os.chdir("C:\\users\\user\\python\\python36-32\\alex")
+    >>> import changefiledata
+    >>> changefiledata.changefiledata("cohort_225.vcf")  <--- here you may insert the other arguments
+'''
+
+def changefiledata(filein="", fileout="", stdcols=9, log_console=False, markchanges=True, workers=1, chunkbytes=16*1024*1024):
+    #check for input files
+    curPath=os.getcwd()+os.path.sep
+    if filein=="":
+        filein=input("Enter the name of file: ")
+    if not os.path.exists(curPath+filein):
+        print("File {} not found in currently working directory. Aborting...".format(filein))
+        return
+
+    # we also create the output file, overwriting it if exists
+    if fileout=="":
+        if filein.endswith(".vcf"):
+            fileout=filein.replace(".vcf","")+"_out.vcf"
+        else:
+            fileout=filein+"_out"
+    # start time counter (just to have an idea of running time)
+    start_time = datetime.now()
+    header=vcf.readHeader(curPath+filein)
+    linenum=0
+    changed=0
+    with open(curPath+fileout,"w") as fout:
+        fout.write(vcf.formatHeader(header))
+        results=vcf.mapLines(curPath+filein,polarizeLines,(stdcols,markchanges,log_console),workers,chunkbytes)
+        for text,nlines,nchanged,messages in results:
+            fout.write(text)
+            if log_console:
+                for i,message in messages:
+                    print("Line {}: {}".format(header.firstdataline+linenum+i+1,message))
+            linenum +=nlines
+            changed +=nchanged
+    # calculate the running time
+    ms=gettimediff(start_time)
+    # print some messages to the user
+    print("Read {} lines, changed {} lines in {} sec".format(linenum, changed, ms/1000))
+
+# cache of FORMAT string -> indexes of GT, AD and PL (-1 if missing). Each worker process keeps its own
+layoutCache={}
+# cache of (number of alleles, k) -> order of the diploid PL values after swapping alleles 0 and k
+permCache={}
+alleleNumber=re.compile(r'\d+')
+
+# Function that changes a list of data lines, run by 'vcf.mapLines'. It returns the text to be written, the
+# number of lines, the number of changed lines and the messages for the console (line index, message)
+def polarizeLines(lines, args):
+    stdcols,markchanges,log_console=args
+    out=[]
+    changed=0
+    messages=[]
+    for i,line in enumerate(lines):
+        line=line.rstrip('\r\n')
+        li=line.split('\t',stdcols)
+        message=polarize(li,stdcols)
+        if message is None: # nothing to change, the line is written as it is
+            out.append(line)
+            continue
+        if message=="":
+            changed +=1
+            line='\t'.join(li)
+            if markchanges:
+                line="*"+line
+            if log_console:
+                messages.append((i,"{} {} REF changed to {}".format(li[0],li[1],li[3])))
+        elif log_console:
+            messages.append((i,message))
+        out.append(line)
+    return ''.join([line+'\n' for line in out]),len(lines),changed,messages
+
+# Function that polarizes a data line, split to 'stdcols' columns and the (unsplit) samples.
+# Returns None if the line needs no change, "" if it was changed or a message if it can not be changed
+def polarize(li, stdcols):
+    if len(li)<8:
+        return None
+    aa=None
+    for item in li[7].split(';'):
+        if item.startswith('AA='):
+            aa=item[3:].split('|')[0].upper()
+            break
+    ref=li[3]
+    if aa is None or aa in ('','.','-','N') or aa==ref.upper():
+        return None
+    alts=li[4].split(',')
+    k=0
+    for j in range(len(alts)):
+        if alts[j].upper()==aa:
+            k=j+1
+            break
+    if k==0:
+        return "{} {} AA={} is not one of the alleles, line not changed".format(li[0],li[1],aa)
+    li[3]=alts[k-1]
+    alts[k-1]=ref
+    li[4]=','.join(alts)
+    if len(li)>stdcols and stdcols>=1:
+        layout=layoutCache.get(li[stdcols-1])
+        if layout is None:
+            formats=li[stdcols-1].split(':')
+            layout=tuple(formats.index(key) if key in formats else -1 for key in ('GT','AD','PL'))
+            layoutCache[li[stdcols-1]]=layout
+        if layout!=(-1,-1,-1):
+            n=len(alts)+1
+            cells=li[stdcols].split('\t')
+            li[stdcols]='\t'.join([swapCell(cell,k,n,layout) for cell in cells])
+    return ""
+
+# Function that swaps alleles 0 and k in the GT, AD and PL values of a sample cell
+def swapCell(cell, k, n, layout):
+    sub=cell.split(':')
+    gt,ad,pl=layout
+    if 0<=gt<len(sub):
+        sub[gt]=swapGT(sub[gt],k)
+    if 0<=ad<len(sub) and sub[ad]!='.':
+        values=sub[ad].split(',')
+        if len(values)>k:
+            values[0],values[k]=values[k],values[0]
+            sub[ad]=','.join(values)
+    if 0<=pl<len(sub) and sub[pl]!='.':
+        values=sub[pl].split(',')
+        if len(values)==n: # haploid: one value for each allele
+            values[0],values[k]=values[k],values[0]
+            sub[pl]=','.join(values)
+        elif len(values)==n*(n+1)//2: # diploid
+            sub[pl]=','.join([values[p] for p in plPermutation(n,k)])
+    return ':'.join(sub)
+
+# Function that swaps alleles 0 and k in a GT value (e.g. with k=1: '0/1' -> '1/0', '1|1' -> '0|0')
+def swapGT(gt, k):
+    ks=str(k)
+    return alleleNumber.sub(lambda m: ks if m.group()=='0' else ('0' if m.group()==ks else m.group()),gt)
+
+# Function that returns, for each diploid genotype (in the VCF order a/b -> b*(b+1)/2+a, a<=b),
+# the index of the genotype it was before swapping alleles 0 and k
+def plPermutation(n, k):
+    perm=permCache.get((n,k))
+    if perm is None:
+        swap=list(range(n))
+        swap[0],swap[k]=k,0
+        perm=[]
+        for b in range(n):
+            for a in range(b+1):
+                x,y=sorted((swap[a],swap[b]))
+                perm.append(y*(y+1)//2+x)
+        permCache[(n,k)]=perm
+    return perm
+
+# Function to calculate time difference (in miliseconds)
+def gettimediff(start_time):
+    dt = datetime.now() - start_time
+    ms = (dt.days * 24 * 60 * 60 + dt.seconds) * 1000 + dt.microseconds / 1000.0
+    return ms
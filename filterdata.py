@@ -1,13 +1,24 @@
 import sys
 import os
+import io
+import re
+import heapq
+import json
+import time
+import shutil
+import tempfile
+import multiprocessing
 from datetime import datetime
 
 ###############################################################################
 ###                          global variables                               ###
 ###############################################################################
-size_limit = 10**(-50)
-block_written = 0
-block_dropped = 0
+size_limit = 10**(-50)    # the default size limit of 'filterdata' (see set_size_limit)
+part_size = 64*1024*1024  # maximum size (in bytes) of the parts of the file filtered in parallel
+progress_check = 10000    # the lines after which the time is checked for progress messages
+run_size = 256*1024*1024  # maximum size (in bytes) of the lines sorted in memory when grouping unsorted files
+fan_in = 64               # maximum number of sorted runs merged at once when grouping unsorted files
+log_line = re.compile(r'(Lines \w+ )(\d+)-(\d+)(.*\n?)$')  # the block messages (see 'copy_log')
 
 ###############################################################################
 ###                             filterdata                                  ###
@@ -25,9 +36,35 @@ block_dropped = 0
                     'max_gene' (optional) it has a predefined value 
                             of 4 (or any other value) and is telling 
                             how many are the different types of 
-                            genes we have in our file'''
+                            genes we have in our file
+                    'workers' (optional) the number of processes that filter
+                            the data (default 1). With more than one, the file
+                            is split in parts at the block boundaries (where the
+                            first column changes), the parts are filtered in 
+                            parallel and their outputs are written in order
+                    'verbose' (optional) if True a message is printed for 
+                            each block, as in older versions (default False).
+                            With more than one worker the messages of each 
+                            part are printed when the part is written
+                    'progress' (optional) the interval in seconds at which 
+                            the lines and blocks read so far are printed
+                            (default 10, 0 for no progress messages)
+                    'logfile' (optional) the name of a file where the message
+                            of each block is written (default "" for none)
+                    'summary' (optional) if True the result is printed as a
+                            JSON line instead of text messages (default False)
+                    'unsorted' (optional) if True the lines of each gene (first 
+                            column) need not be together in the file: they are
+                            grouped first with an external sort that keeps at 
+                            most 'run_size' bytes of lines in memory, and the 
+                            blocks are written in the order of the gene. The 
+                            lines of a gene keep their order (default False)
+         It returns a dictionary with the metrics of the run: lines, 
+         blocks_written, blocks_dropped, lines_written, lines_dropped,
+         bytes_read (the bytes of the input file, in both modes), seconds 
+         and lines_per_sec'''
 
-def filterdata(argin="", argout="", max_gene=54):
+def filterdata(argin="", argout="", max_gene=54, workers=1, verbose=False, progress=10, logfile="", summary=False, unsorted=False):
     # get the filein
     # filein = file containing our input data (must be in the same folder with 'alex.py')
     # REMEMBER that the input file must have the extension '.txt' otherelse the file will not be found
@@ -68,12 +105,9 @@ def filterdata(argin="", argout="", max_gene=54):
         fileout=sss+"_out."+gg[len(gg)-1]
         fileoutdrop=sss+"_out_drop."+gg[len(gg)-1]
     
-    print("Started filtering input file")
+    if not summary:
+        print("Started filtering input file")
     start_time = datetime.now()
-    # name the globals (these globals will be used in print_lines later on)
-    global size_limit
-    global block_written
-    global block_dropped
 
     # Open files and start the main loop \
     # We read each line (one by one) from the filein
@@ -93,139 +127,412 @@ def filterdata(argin="", argout="", max_gene=54):
     # We only keep the genes that are nearest to zero (only four items in every block)
     # If two gene2 are identical then we accept them without testing the size
 
-    genes=[] # list where we will keep the 3 first letters of each different gene
-    genes_total=[] # list where we will keep all the string of each different gene
     fout=open(fileout,"w")
     fout2 = open(fileoutdrop,"w")
-    
-    with open(filein) as fp:
-        cnt=0
-        oldgene=""
-        line_start=0     #at which line the block starts
-        line_end=0       #at which line the block ends
-        line_list=[]     #it keeps all the lines of the block
-        data={}          #dictinary containing gene2-size pairs
-        dropblock=False  #boolean to flag if we should discard the block
-        for line in fp:
-            li = line.strip('\r\n\t').split('\t')
-            gene=li[0]                  #First column
-            gene2=li[1][0:9]            #Second column (only first 9 characters)
-            gene2_total=li[1]           #Second column (all string)
-            #length=li[2].strip()       #Third column -- Not really needed
-            size=li[3].strip('\r\n\t ') #Fouth column
-            if oldgene!=gene: 
-                #in this case we found the end of the current block, so it time to manipulate it
-                line_end=cnt
-                if line_start!=line_end:
-                    if not dropblock:
-                        print_lines(line_list,genes,line_start, cnt, fout,fout2,max_gene)
-                    else:
-                        for i in range(len(line_list)):
-                            print("{}".format(line_list[i]),end='',file=fout2)
-                        print("Lines dropped {}-{} ({})".format(line_start+1,cnt, cnt-line_start))
-                        block_dropped+=1
-                # be prepared for the next block
-                oldgene=gene
-                genes=[]
-                genes.append(gene2)
-                genes_total=[]
-                genes_total.append(gene2_total)
-                data={}
-                data[gene2]=float(size)
-                line_start=cnt
-                line_list=[]
-                line_list.append(line)
-                dropblock=False
-            else: # we are still in the same block, so do your stuff!!!
-                if gene2 not in genes:
-                    line_list.append(line)
-                    genes.append(gene2)
-                    genes_total.append(gene2_total)
-                    data[gene2]=float(size)
-                else: # we found a gene twice, so check for size
-                    if gene2_total in genes_total: # if gene2_total has an identical in genes_total
-                        line_list.append(line)
-                    elif data[gene2]==0 and float(size)==0: #if same gene2 are both zero we have to drop the block
-                        line_list.append(line)
-                        dropblock=True
-                    elif data[gene2]/float(size) <= size_limit: #10**(-50): # it's OK to add it and continue
-                        line_list.append(line)
-                    else: # it's NOT OK, so we have to drop the block (still continue reading lines)
-                        line_list.append(line)
-                        dropblock=True
-            cnt+=1
-    # now we have to save last block if it is not dropped
-    if not dropblock:
-        print_lines(line_list,genes,line_start, cnt, fout,fout2,max_gene)
+    # the log of the blocks is written with a big buffer, so it does not slow down the filtering
+    flog=open(logfile,"w",buffering=1024*1024) if logfile!="" else None
+    folder=os.path.dirname(os.path.abspath(fileout))
+    grouped=None
+    if unsorted and workers>1:
+        # the grouped lines are written to a temporary file that is then split in parts
+        with tempfile.NamedTemporaryFile('w',dir=folder,suffix='.group',delete=False) as fg:
+            for lines in group_lines(filein,folder):
+                fg.writelines(lines)
+        grouped=fg.name
+    if workers<=1:
+        # the lines are read in binary mode, so that 'bytes_read' counts the bytes of the file
+        with open(filein,'rb') as fp:
+            bf=BlockFilter(fout,fout2,max_gene,size_limit,verbose=verbose,progress=progress,log=flog)
+            if unsorted:
+                for lines in group_lines(filein,folder):
+                    bf.feed(lines)
+            else:
+                bf.feed(fp)
+            bf.finish()
+        metrics=bf.metrics()
     else:
-        for i in range(len(line_list)):
-            print("{}".format(line_list[i]),end='',file=fout2)
-        print("Lines dropped {}-{} ({})".format(line_start+1,cnt, cnt-line_start))
-        block_dropped+=1
+        # the blocks are filtered in parallel, in parts of the file that start at a block
+        # boundary, and the outputs of the parts are copied to fout and fout2 in their order
+        fout.flush()
+        fout2.flush()
+        source=grouped if grouped is not None else filein
+        parts=block_ranges(source,max(workers*4,os.path.getsize(source)//part_size))
+        # the parts keep their block messages in temporary logs when they are printed or logged
+        tasks=[(source,start,end,max_gene,size_limit,fileout,verbose or flog is not None) for start,end in parts]
+        metrics=None
+        last=time.time()
+        with multiprocessing.Pool(workers) as pool:
+            for part_metrics,part_out,part_drop,part_log in pool.imap(filter_part,tasks):
+                if part_log is not None: # the lines of the part are numbered from the lines of the previous parts
+                    copy_log(part_log,flog,metrics['lines'] if metrics else 0,verbose)
+                    os.remove(part_log)
+                metrics=add_metrics(metrics,part_metrics)
+                for part,fo in ((part_out,fout),(part_drop,fout2)):
+                    with open(part,'rb') as fi:
+                        shutil.copyfileobj(fi,fo.buffer)
+                    os.remove(part)
+                if progress>0 and time.time()-last>=progress:
+                    print(progress_message(metrics,(datetime.now()-start_time).total_seconds()))
+                    last=time.time()
     # close opened files
     fout.close()
     fout2.close()
-    # calculate needed timeBlocks written:{}
+    if flog is not None:
+        flog.close()
+    if grouped is not None:
+        os.remove(grouped)
+    if unsorted: # the grouped lines were filtered, but all the bytes of the file were read
+        metrics['bytes_read']=os.path.getsize(filein)
+    # calculate needed time
     dt = datetime.now() - start_time
     ms = (dt.days * 24 * 60 * 60 + dt.seconds) * 1000 + dt.microseconds / 1000.0
+    metrics['seconds']=ms/1000
+    metrics['lines_per_sec']=metrics['lines']/(ms/1000) if ms>0 else 0
     # print messages to console
-    print("Blocks written: {}. Blocks dropped: {}".format(block_written,block_dropped))
-    print("Time needed: {:.1f} seconds ({:.3f} ms per line)".format(ms/60, ms/cnt))
-    print("Finished filtering input file.\nFiltered data in file '{}'\nDropped data in file '{}'".format(fileout,fileoutdrop))
+    if summary:
+        result=dict(metrics)
+        result.update({'file_in':filein, 'file_out':fileout, 'file_drop':fileoutdrop})
+        print(json.dumps(result))
+    else:
+        print("Blocks written: {}. Blocks dropped: {}".format(metrics['blocks_written'],metrics['blocks_dropped']))
+        print("Lines written: {}. Lines dropped: {}".format(metrics['lines_written'],metrics['lines_dropped']))
+        print("Time needed: {:.1f} seconds ({:.3f} ms per line, {:.0f} lines per second)".format(ms/1000, ms/max(metrics['lines'],1), metrics['lines_per_sec']))
+        print("Finished filtering input file.\nFiltered data in file '{}'\nDropped data in file '{}'".format(fileout,fileoutdrop))
+    return metrics
 
 
 ###############################################################################
-###               Methods used internally in 'filterdata'                   ###
+###                             BlockFilter                                 ###
 ###############################################################################
-
-def print_lines(l_list, gen, l_start, cnt1, fiout, fiout2, m_gene):
-    ''' <print_lines> function
-        Gets a list of lines and writes to the 'fiout' file the 'max_gene'
-        lines that fullfill some criteria. 
+class BlockFilter:
+    ''' <BlockFilter> class
+        Applies the block rules of 'filterdata' to a stream of lines. Everything
+        (the limits and the counters) is kept in the object, so many filters can
+        run at the same time, e.g. in threads or for different files.
           Syntax:
-              l_list: list of the lines in the block we have to export to file
-              gen:    the list of the genes (9 first letters) in the block
-              l_start: the line of the input-file where the block starts
-              cnt1:   the lineof the input-file where the block ends  
-              fiout:  the file opened for writting the filtered data
-              fiout2: the file opened for writting the dropped lines
-              m_gene: the number of genes we have to contain in each block 
-                      (not more neither less)'''
-    
-    global block_written
-    global block_dropped 
-    if len(gen)>=m_gene: #check if we have all 4 genes in our block
-        if len(l_list)==m_gene: #in which case, if all lines are exactly four then save them
-            for i in range(len(l_list)):
-                print("{}".format(l_list[i]),end='',file=fiout)
-            print("Lines written {}-{} ({})".format(l_start+1,cnt1, cnt1-l_start))
-            block_written += 1
-        else: #else find the better four lines
-            lines=[]
-            for line in l_list: #sorted(l_list, key=lambda line: line.split()[3]):
-                lines.append(line.split('\t'))
-            drop=[]
-            for i in range(len(lines)):
-                for j in range(i):
-                    if lines[i][1][0:9] == lines[j][1][0:9]:
-                        if float(lines[i][3])>float(lines[j][3]):
-                            drop.append(i)
-                        else:
-                            drop.append(j)
+              bf = BlockFilter(fout, fout2, max_gene=54, size_limit=10**(-50), prefix=9, verbose=False, progress=0, log=None)
+              bf.feed(lines)   (as many times as needed, e.g. with an open file)
+              bf.finish()      (writes the last block)
+          where:
+              fout:       the file opened for writting the filtered data
+              fout2:      the file opened for writting the dropped lines
+              max_gene:   the number of genes we have to contain in each block
+              size_limit: the limit of the fraction of the sizes of the same gene
+              prefix:     the number of the first letters of the second column 
+                          that make the gene (gene2)
+              verbose:    if True a message is printed for each block
+              progress:   the interval in seconds at which the lines and blocks 
+                          read so far are printed (0 for no progress messages)
+              log:        a file opened for writting the message of each block
+          and the counters are:
+              lines, blocks_written, blocks_dropped, lines_written, lines_dropped,
+              bytes_read (the bytes of the lines fed as bytes, which are decoded as
+              UTF-8 with '\r\n' read as '\n', or the characters of text lines)
+          that bf.metrics() returns in a dictionary, with the seconds since the 
+          object was created and the lines per second'''
+
+    def __init__(self, fout, fout2, max_gene=54, size_limit=10**(-50), prefix=9, verbose=False, progress=0, log=None):
+        self.fout=fout
+        self.fout2=fout2
+        self.max_gene=max_gene
+        self.size_limit=size_limit
+        self.prefix=prefix
+        self.verbose=verbose
+        self.progress=progress
+        self.log=log
+        self.start_time=time.time()
+        self.last_progress=self.start_time
+        self.next_check=progress_check
+        self.lines=0           #the lines read (all blocks)
+        self.bytes_read=0
+        self.blocks_written=0
+        self.blocks_dropped=0
+        self.lines_written=0
+        self.lines_dropped=0
+        self.oldgene=None      #the gene (first column) of the current block
+        self.line_start=0      #at which line the current block starts
+        self.line_list=[]      #it keeps all the lines of the block
+        self.genes=set()       #set where we will keep the first letters of each different gene2
+        self.genes_total=set() #set where we will keep all the string of each different gene2
+        self.data={}           #dictinary containing gene2-size pairs
+        self.best={}           #dictionary gene2 -> [index in line_list, size] of the line with the smallest size (the last one if equal)
+        self.dropblock=False   #boolean to flag if we should discard the block
+
+    def feed(self, lines):
+        # For each line read, we get values for the four variables:
+        #   gene   = the text of first column
+        #   gene2  = the first 'prefix' letters of the text in second column
+        #   gene2_total = the text in second column (total string)
+        #   size   = the text in fourth column converted to float
+        prefix=self.prefix
+        for line in lines:
+            if isinstance(line,bytes): # a line read in binary mode, so its real size is counted
+                self.bytes_read+=len(line)
+                line=line.decode('utf-8')
+                if line.endswith('\r\n'):
+                    line=line[:-2]+'\n'
+            else:
+                self.bytes_read+=len(line)
+            li = line.strip('\r\n\t').split('\t')
+            gene=li[0]                  #First column
+            gene2=li[1][0:prefix]       #Second column (only first 'prefix' characters)
+            gene2_total=li[1]           #Second column (all string)
+            size=float(li[3].strip('\r\n\t ')) #Fouth column
+            if self.oldgene!=gene: 
+                #in this case we found the end of the current block, so it time to manipulate it
+                self.end_block()
+                # be prepared for the next block
+                self.oldgene=gene
+                self.genes={gene2}
+                self.genes_total={gene2_total}
+                self.data={gene2:size}
+                self.line_start=self.lines
+                self.line_list=[line]
+                self.best={gene2:[0,size]}
+                self.dropblock=False
+            else: # we are still in the same block, so do your stuff!!!
+                data=self.data
+                if gene2 not in self.genes:
+                    self.genes.add(gene2)
+                    self.genes_total.add(gene2_total)
+                    data[gene2]=size
+                else: # we found a gene twice, so check for size
+                    if gene2_total in self.genes_total: # if gene2_total has an identical in genes_total
+                        pass
+                    elif data[gene2]==0 and size==0: #if same gene2 are both zero we have to drop the block
+                        self.dropblock=True
+                    elif data[gene2]/size <= self.size_limit: # it's OK to add it and continue
+                        pass
+                    else: # it's NOT OK, so we have to drop the block (still continue reading lines)
+                        self.dropblock=True
+                # keep the line with the smallest size for each gene2 (the last one if equal sizes)
+                b=self.best.get(gene2)
+                if b is None:
+                    self.best[gene2]=[len(self.line_list),size]
+                elif not size>b[1]:
+                    b[0]=len(self.line_list)
+                    b[1]=size
+                self.line_list.append(line)
+            self.lines+=1
+            if self.lines>=self.next_check: # time is checked every 'progress_check' lines
+                self.next_check+=progress_check
+                if self.progress>0 and time.time()-self.last_progress>=self.progress:
+                    print(progress_message(self.metrics(),time.time()-self.start_time))
+                    self.last_progress=time.time()
+
+    def metrics(self):
+        # returns a dictionary with the counters and the speed of the filter
+        seconds=time.time()-self.start_time
+        return {'lines':self.lines, 'blocks_written':self.blocks_written, 'blocks_dropped':self.blocks_dropped,
+                'lines_written':self.lines_written, 'lines_dropped':self.lines_dropped, 'bytes_read':self.bytes_read,
+                'seconds':seconds, 'lines_per_sec':self.lines/seconds if seconds>0 else 0}
+
+    def message(self, text):
+        # the message of a block, printed and/or written to the log
+        if self.verbose:
+            print(text)
+        if self.log is not None:
+            self.log.write(text+"\n")
+
+    def finish(self):
+        # writes the last block and returns the object (to read the counters)
+        self.end_block()
+        self.oldgene=None
+        return self
+
+    def end_block(self):
+        # writes the current block to 'fout' and/or 'fout2' (if there is one)
+        l_list=self.line_list
+        if len(l_list)==0:
+            return
+        l_start=self.line_start
+        cnt1=self.lines
+        self.line_list=[]
+        if self.dropblock or len(self.genes)<self.max_gene: #check if we have all the genes in our block
+            self.fout2.write(''.join(l_list))
+            if self.verbose or self.log is not None:
+                self.message("Lines dropped {}-{} ({})".format(l_start+1,cnt1, cnt1-l_start))
+            self.blocks_dropped+=1
+            self.lines_dropped+=len(l_list)
+        elif len(l_list)==self.max_gene: #in which case, if all lines are exactly 'max_gene' then save them
+            self.fout.write(''.join(l_list))
+            if self.verbose or self.log is not None:
+                self.message("Lines written {}-{} ({})".format(l_start+1,cnt1, cnt1-l_start))
+            self.blocks_written+=1
+            self.lines_written+=len(l_list)
+        else: #else keep the best line of each gene
+            keep=set(b[0] for b in self.best.values())
             cc=0
-            for i in range(len(lines)):
-                if i not in drop:
-                    print("{}".format(l_list[i]),end='',file=fiout)
+            for i in range(len(l_list)):
+                if i in keep:
+                    self.fout.write(l_list[i])
                     cc+=1
                 else:
-                    print("--->{}".format(l_list[i]),end='',file=fiout2) 
-            print("Lines written {}-{} ({}/{})".format(l_start+1,cnt1, cc,cnt1-l_start-cc))
-            block_written += 1
-    else:
-        for i in range(len(l_list)):
-            print("{}".format(l_list[i]),end='',file=fiout2)
-        print("Lines dropped {}-{} ({})".format(l_start+1,cnt1, cnt1-l_start))
-        block_dropped += 1
+                    self.fout2.write("--->"+l_list[i])
+            if self.verbose or self.log is not None:
+                self.message("Lines written {}-{} ({}/{})".format(l_start+1,cnt1, cc,cnt1-l_start-cc))
+            self.blocks_written+=1
+            self.lines_written+=cc
+            self.lines_dropped+=len(l_list)-cc
+
+###############################################################################
+###               Methods used internally in 'filterdata'                   ###
+###############################################################################
+
+def filter_part(args):
+    ''' <filter_part> function
+        Filters the lines of a part of the input file (from byte 'start' to byte
+        'end') to temporary files, run by the processes of 'filterdata'. 
+        Gets a tuple (filein, start, end, max_gene, size_limit, fileout, log) and 
+        returns the metrics of the part and the names of the temporary files
+        of the filtered and the dropped lines and of the log (None if not log)'''
+    filein,start,end,max_gene,size_lim,fileout,log=args
+    with open(filein,'rb') as fi:
+        fi.seek(start)
+        data=fi.read(end-start)
+    folder=os.path.dirname(os.path.abspath(fileout))
+    flog=tempfile.NamedTemporaryFile('w',dir=folder,suffix='.part',delete=False) if log else None
+    with tempfile.NamedTemporaryFile('w',dir=folder,suffix='.part',delete=False) as fout:
+        with tempfile.NamedTemporaryFile('w',dir=folder,suffix='.part',delete=False) as fout2:
+            bf=BlockFilter(fout,fout2,max_gene,size_lim,log=flog)
+            bf.feed(io.BytesIO(data))
+            bf.finish()
+    if flog is not None:
+        flog.close()
+    metrics=bf.metrics()
+    return metrics,fout.name,fout2.name,flog.name if flog is not None else None
+
+def add_metrics(total, part):
+    ''' <add_metrics> function
+        Adds the counters of the metrics 'part' to 'total' (None for the first part)'''
+    if total is None:
+        return dict(part)
+    for key in ('lines','blocks_written','blocks_dropped','lines_written','lines_dropped','bytes_read'):
+        total[key]+=part[key]
+    return total
+
+def progress_message(metrics, seconds):
+    ''' <progress_message> function
+        Returns the progress message for the metrics of a filter after 'seconds' seconds'''
+    return "Read {} lines ({:.1f} MB) in {:.1f} sec ({:.0f} lines/sec). Blocks written: {}. Blocks dropped: {}".format(
+        metrics['lines'], metrics['bytes_read']/(1024*1024), seconds, metrics['lines']/seconds if seconds>0 else 0,
+        metrics['blocks_written'], metrics['blocks_dropped'])
+
+def copy_log(part_log, flog, offset, verbose=False):
+    ''' <copy_log> function
+        Copies the block messages of a part (filtered by 'filter_part') to 'flog'
+        (None for no log file) and prints them if 'verbose', adding 'offset' (the 
+        lines of the previous parts) to their line numbers'''
+    with open(part_log) as fi:
+        for text in fi:
+            m=log_line.match(text)
+            if m:
+                text="{}{}-{}{}".format(m.group(1),int(m.group(2))+offset,int(m.group(3))+offset,m.group(4))
+            if verbose:
+                print(text.rstrip('\n'))
+            if flog is not None:
+                flog.write(text)
+
+def gene_key(line):
+    ''' <gene_key> function
+        Returns the gene (first column) of a line, the key of the blocks'''
+    return line.strip('\r\n\t').split('\t',1)[0]
+
+def group_lines(filein, folder):
+    ''' <group_lines> function
+        A generator that reads a file where the lines of a gene (first column)
+        may be anywhere and yields its lines sorted by gene, in lists (one for
+        each sorted run or, at the end, for the lines of many genes). The sort
+        is stable, so the lines of a gene keep their order in the file.
+        Runs of up to 'run_size' bytes are sorted in memory and written to 
+        temporary files in 'folder', which are then merged, at most 'fan_in' 
+        of them at once (in more passes if needed)'''
+    runs=[]
+    try:
+        with open(filein) as fp:
+            lines=fp.readlines(run_size)
+            while lines:
+                peek=fp.readline() # the first line of the next run ("" at the end of the file)
+                if not lines[-1].endswith('\n'):
+                    lines[-1]+='\n'
+                lines.sort(key=gene_key)
+                if not runs and peek=="":
+                    yield lines # all the file fits in one run, no need for temporary files
+                    return
+                with tempfile.NamedTemporaryFile('w',dir=folder,suffix='.run',delete=False) as fr:
+                    fr.writelines(lines)
+                runs.append(fr.name)
+                lines=[peek]+fp.readlines(run_size) if peek!="" else []
+        # merge the runs (consecutive runs, so that the merge stays stable) until at most 'fan_in' are left
+        while len(runs)>fan_in:
+            merged=[]
+            for i in range(0,len(runs),fan_in):
+                group=runs[i:i+fan_in]
+                if len(group)==1:
+                    merged.append(group[0])
+                    continue
+                with tempfile.NamedTemporaryFile('w',dir=folder,suffix='.run',delete=False) as fr:
+                    fr.writelines(merge_runs(group))
+                for run in group:
+                    os.remove(run)
+                merged.append(fr.name)
+            runs=merged
+        buf=[]
+        for line in merge_runs(runs):
+            buf.append(line)
+            if len(buf)>=progress_check:
+                yield buf
+                buf=[]
+        if buf:
+            yield buf
+    finally:
+        for run in runs:
+            if os.path.exists(run):
+                os.remove(run)
+
+def merge_runs(runs):
+    ''' <merge_runs> function
+        A generator that merges the sorted runs (temporary files) by gene. For
+        equal genes the lines of the first runs come first (heapq.merge is stable)'''
+    files=[open(run) for run in runs]
+    try:
+        for line in heapq.merge(*files,key=gene_key):
+            yield line
+    finally:
+        for f in files:
+            f.close()
+
+def block_ranges(filein, parts):
+    ''' <block_ranges> function
+        Splits the file in (up to) 'parts' byte ranges (start, end) of about 
+        equal size, each one starting at the start of a block (a line where
+        the first column is different from the one of the previous line)'''
+    size=os.path.getsize(filein)
+    bounds=[0]
+    with open(filein,'rb') as fi:
+        for i in range(1,parts):
+            p=size*i//parts
+            if p<=bounds[-1]:
+                continue
+            fi.seek(p-1)
+            fi.readline() # go to the start of the next line
+            line=fi.readline()
+            if not line:  # p is inside the last line, so there is no block after it
+                continue
+            gene=line.strip(b'\r\n\t').split(b'\t')[0]
+            p=None
+            while True:   # and then to the start of the next block
+                start=fi.tell()
+                line=fi.readline()
+                if not line:
+                    break
+                if line.strip(b'\r\n\t').split(b'\t')[0]!=gene:
+                    p=start
+                    break
+            if p is not None and bounds[-1]<p<size:
+                bounds.append(p)
+    bounds.append(size)
+    return list(zip(bounds[:-1],bounds[1:]))
 
 def set_size_limit(sl):
     global size_limit
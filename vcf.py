@@ -4,8 +4,28 @@
 
     Named functions:
     -------------------------------------------------------------------------------------------------------
-    fields, meta, info, filter, format, data, fileformat = vcf.read('some_file_name_for_vcf', getdata=True)
+    fields, meta, info, filter, format, data, fileformat = vcf.read('some_file_name_for_vcf', getdata=True, compact=False)
                  if getdata=False then the returned 'data' is an empty list of dictionaries.
+                 if compact=True then 'data' is a list of VCFRecord objects instead of dictionaries
+                 (the same holds for the 'compact' argument of iterRecords and getData)
+                 if samples=['name1','name2',...] (or zero-based positions) only these samples are read
+                 (the same holds for the 'samples' argument of iterRecords, getData and loadGenotypes)
+                 if where='FILTER==PASS && QUAL>=30' (see vcf.compileFilter) only the lines that pass
+                 the filter are read (the same holds for iterRecords, iterBatches and loadGenotypes)
+                 ------------------------------------------------------------------------------------------
+    for dic in vcf.iterRecords('some_file_name_for_vcf', compact=False):
+                 yields the data dictionaries (the same as 'read' returns in 'data') one at a time,
+                 so big files can be processed without keeping all their data in memory
+                 ------------------------------------------------------------------------------------------
+    header     = vcf.readHeader('some_file_name_for_vcf')
+                 returns a VCFHeader object with the fields, meta, info, filt, form and fileformat of the file
+                 reading only the header lines (so it is fast no matter how big the data section is)
+                 ------------------------------------------------------------------------------------------
+    lines      = vcf.write('some_file_name_for_vcf', header, records, compress=False)
+                 writes the header (a VCFHeader, e.g. from readHeader) and the records (VCFRecords, dictionaries
+                 or text lines) with large buffered writes, optionally compressed with bgzip. The '##' lines
+                 of the header are written as they were read. For writing records one by one or in batches
+                 use writer=vcf.VCFWriter('some_file_name_for_vcf', header) and writer.write(rec)
                  ------------------------------------------------------------------------------------------
     fields     = vcf.getFields('some_file_name_for_vcf')
                  returns a list with all the fields contained in the 'some_file_name_for_vcf' file
@@ -25,26 +45,84 @@
     fileformat = vcf.getFileformat('some_file_name_for_vcf')
                  returns a string containing the type and version of 'some_file_name_for_vcf' file
                  ------------------------------------------------------------------------------------------
-    data       = vcf.getData('some_file_name_for_vcf', startLine=0, num_of_lines=1)
+    data       = vcf.getData('some_file_name_for_vcf', startLine=0, num_of_lines=1, useindex=False, compact=False)
                  returns a list of dictionaries of the data contained in the 'some_file_name_for_vcf' file
                  starting at the 'startLine' line of data. The list contains 'num_of_lines' dictionaries
                  with data.
                  'startLine' is the 1-based line number fro where the grepping starts, so letting it to have 
                  zero value, it returns an empty list of dictionaries
+                 if useindex=True the line index of the file is used (see buildIndex) to seek near 'startLine'
                  ------------------------------------------------------------------------------------------
     firstline  = vcf.getFirstDataline('some_file_name_for_vcf')
                  returns the line number of the first line containing data
                  ------------------------------------------------------------------------------------------
-    sampledata = vcf.getSampleData('some_file_name_for_vcf', line_number)
+    sampledata = vcf.getSampleData('some_file_name_for_vcf', line_number, useindex=False)
                  returns a dictionary with all the 'sample_name':'value' pairs for the 'line_number' data-line
                  ------------------------------------------------------------------------------------------
-    [to console] vcf.printSampleData('some_file_name_for_vcf', line_number)
+    [to console] vcf.printSampleData('some_file_name_for_vcf', line_number, useindex=False)
                  prints the 'sample_name':'value' pairs for all samples contained in the 'line_number' data-line
+                 ------------------------------------------------------------------------------------------
+    vcf_file   = vcf.VCFFile('some_file_name_for_vcf', useindex=True)
+                 opens the file once for many queries: vcf_file.data(line_number), vcf_file.sampleData(line_number)
+                 and vcf_file.sample('sample_name', line_number) return the same as getData (one line),
+                 getSampleData and a single sample value, without reading the header or the file again
+                 ------------------------------------------------------------------------------------------
+    index      = vcf.buildIndex('some_file_name_for_vcf', step=1000)
+                 reads the file once and saves (as 'some_file_name_for_vcf.vidx') the byte offset of every
+                 'step'-th data line, keyed by the size and modification time of the file
+                 ------------------------------------------------------------------------------------------
+    index      = vcf.loadIndex('some_file_name_for_vcf')
+                 returns the saved line index of the file, building it again if the file has changed
+                 ------------------------------------------------------------------------------------------
+    genotypes  = vcf.loadGenotypes('some_file_name_for_vcf', formats=('GT','DP','GQ'), ploidy=2, workers=1,
+                                   fixed=('CHROM','POS'), cache=False)
+                 returns a dictionary of NumPy arrays (sites x samples) with the GT allele codes (int8)
+                 and the DP, GQ values (int32) of all samples, plus the 'fixed' columns and 'samples'
+                 with workers>1 the file is loaded in parallel by a pool of processes
+                 with cache=True the arrays are saved in 'some_file_name_for_vcf.vcache' (one sub-folder for
+                 each samples, where and ploidy) and later calls load them from there (memory-mapped) until
+                 the file changes
+                 ------------------------------------------------------------------------------------------
+    infodata   = vcf.loadInfo('some_file_name_for_vcf', ['DP','AF','AA'], width=1)
+                 returns a dictionary of NumPy arrays with the values of the asked INFO keys for all data
+                 lines, typed by the '##INFO' lines of the header (see also vcf.parseInfo, vcf.infoTypes)
+                 ------------------------------------------------------------------------------------------
+    for batch in vcf.iterBatches('some_file_name_for_vcf', workers=None, compact=True):
+                 yields lists (batches) of data lines in file order, parsed in parallel by a pool of
+                 processes, each one reading its own byte range of the file
+                 ------------------------------------------------------------------------------------------
+    for result in vcf.mapLines('some_file_name_for_vcf', func, arg=None, workers=None):
+                 calls func(lines, arg) with chunks of the data lines in a pool of processes and yields
+                 the results in file order (for whole-file passes that change or summarize every line)
+                 ------------------------------------------------------------------------------------------
+    for result in vcf.imapBounded(pool, func, tasks, window):
+                 yields func(task) for the tasks run by a multiprocessing pool, in the order of the tasks
+                 like pool.imap, but reading at most 'window' tasks ahead of the results
+                 ------------------------------------------------------------------------------------------
+    for dic in vcf.query('some_file_name_for_vcf', chrom, start, end, compact=False):
+                 yields the data lines with the given CHROM and start<=POS<=end. For files compressed
+                 with bgzip only the blocks of the region are decompressed, using the block index that
+                 vcf.buildBgzfIndex saves as 'some_file_name_for_vcf.vbi'. For uncompressed files only
+                 the lines of the region are read, using the position index (sorted POS and byte offsets
+                 per CHROM) that vcf.buildPosIndex saves as 'some_file_name_for_vcf.vpi'
     -------------------------------------------------------------------------------------------------------
+    All the functions accept also files compressed with gzip or bgzip (e.g. 'cohort_225.vcf.gz')
 '''
 import sys
 import os
+import json
+import gzip
+import zlib
+import struct
+import operator
+import copy
+import hashlib
+import uuid
+import multiprocessing
+from bisect import bisect_left, bisect_right
+from array import array
 from itertools import islice
+from collections import deque
 
 ###############################################################################
 ###                          global variables                               ###
@@ -65,6 +143,15 @@ vcf_format = {'AD' : 'Read depth for each allele (Integer)',
               'PL' : 'Phred-scaled genotype likelihoods rounded to the closest integer (Integer)',
               'PQ' : 'Phasing quality (Integer)',
               'PS' : 'Phase set (Integer)' }
+MISSING=-1        # value of the missing calls in the arrays of 'loadGenotypes'
+index_ext='.vidx' # extension of the line-index file (see 'buildIndex')
+_indexes={}       # line-indexes already loaded, by file name
+cache_ext='.vcache' # extension of the folder of the cached arrays (see 'loadGenotypes')
+bgzf_index_ext='.vbi' # extension of the BGZF block-index file (see 'buildBgzfIndex')
+_bgzfindexes={}   # BGZF block-indexes already loaded, by file name
+pos_index_ext='.vpi' # extension of the position-index file (see 'buildPosIndex')
+_posindexes={}    # position-indexes already loaded, by file name
+bgzf_block_size=65280 # the (uncompressed) size of the BGZF blocks written by 'VCFWriter'
 
 
 ###############################################################################
@@ -81,6 +168,15 @@ vcf_format = {'AD' : 'Read depth for each allele (Integer)',
     four lists of dictionaries 'info', 'filt', 'form', 'data'
     and a string containing the type of file (e.g. vcf)
     If optional input 'detdata' set to False then data list is empty
+    If optional input 'compact' set to True then data list contains VCFRecord
+    objects (see class VCFRecord) instead of dictionaries
+    If optional input 'samples' is a list of sample names or (zero-based) sample
+    positions, only these samples are kept (in the given order) and the rest of
+    each data line is not split at all. The returned 'fields' then contain only
+    these samples.
+    If optional input 'where' is a filter expression (see 'compileFilter'), only
+    the data lines that pass it are kept. The filter is checked on the fixed
+    columns before the line is split any further.
     *************************** example ****************************
     function call: 
     fields,meta,info,filter,format,data,fileformat = vcf.read('some_file_name.txt', getdata=True)
@@ -122,111 +218,375 @@ vcf_format = {'AD' : 'Read depth for each allele (Integer)',
                 print("{}: {}".format(data[x]['sample'+str(i)],data[x]['data'+str(i)]))
 '''  
 
-def read(file, getdata=True):
+def read(file, getdata=True, compact=False, samples=None, where=None):
     # variables
-    fields=[] # list that holds the fields names 
-    meta={}   # dictionary that hold the meta-data of the file (e.g phasing=partial or fileformat=VCFv4.0 
-    info=[]   # list of dictionaries that hold the Info meta-data 
-    filt=[]   # list of dictionaries that hold the Filter meta-data 
-    form=[]   # list of dictionaries that hold the Format meta-data 
     data=[]   # list of dictionaries that hold the real data for each sample
-    fileformat="unknown" # the type of fileformat
-    firstdataline="" # first data line in case no data needed (getdata=False)
+    # the meta-data (and the fields) are read by 'readHeader'
+    header,cols=_selectSamples(readHeader(file),samples)
+    if getdata==True:
+        data=list(_iterData(file,header,compact,cols,where))
+    return header.fields,header.meta,header.info,header.filt,header.form,data,header.fileformat
 
-    # check filename and if it is empty or does not exist return empty lists
-    if file=='' or not os.path.isfile(file):
-        print("File '{}' NOT found.".format(file))
-        return fields,meta,info,filt,form,data
-    fi=open(file,'r')
-    # the loop that reads the meta-data and data
-    for content in fi:
-        if content[:2]=='##': #meta-data
-            if content[2:6].upper()=='INFO':
-                tmp=content[8:len(content)-2]
-                tmp_list=tmp.split(',')
-                tmp_d={}
-                for ss in tmp_list:
-                    ss2=ss.split('=')
-                    if len(ss2)==2:
-                        tmp_d[ss2[0]]=ss2[1]
-                info.append(tmp_d)
-            elif content[2:8].upper()=='FILTER':
-                tmp=content[10:len(content)-2]
-                tmp_list=tmp.split(',')
-                tmp_d={}
-                for ss in tmp_list:
-                    ss2=ss.split('=')
-                    if len(ss2)==2:
-                        tmp_d[ss2[0]]=ss2[1]
-                filt.append(tmp_d)
-            elif content[2:8].upper()=='FORMAT':
-                tmp=content[10:len(content)-2]
-                tmp_list=tmp.split(',')
-                tmp_d={}
-                for ss in tmp_list:
-                    ss2=ss.split('=')
-                    if len(ss2)==2:
-                        tmp_d[ss2[0]]=ss2[1]
-                form.append(tmp_d)
-            elif content[2:12].upper()=='FILEFORMAT':
-                fileformat=content.split('=')[1].strip()
+###############################################################################
+###                             iterRecords                                 ###
+###############################################################################
+''' Function iterRecords
+    input:  file, the name of a file to read the data from
+    output: a generator that yields the data lines one by one
+
+    Yields the same dictionaries that 'read' puts in its 'data' list, but one
+    at a time, so the memory needed does not depend on the size of the file.
+    Use it instead of 'read' for big files.
+    If optional input 'compact' set to True then VCFRecord objects are yielded
+    instead of dictionaries.
+    If optional input 'samples' is given, only these samples are kept (see 'read').
+    If optional input 'where' is given, only the lines that pass it are yielded (see 'read').
+    *************************** example ****************************
+    for dic in vcf.iterRecords('some_file_name.txt'):
+        if dic['FILTER']=='PASS':
+            print(dic['CHROM'],dic['POS'])
+'''
+def iterRecords(file, compact=False, samples=None, where=None):
+    header,cols=_selectSamples(readHeader(file),samples)
+    return _iterData(file,header,compact,cols,where)
+
+# Generator that yields the data lines of the file (as dictionaries or VCFRecords) one by one
+def _iterData(file, header, compact=False, cols=None, where=None):
+    if header.dataoffset<0:
+        return
+    where=compileFilter(where)
+    with _open(file) as fi:
+        fi.seek(header.dataoffset)
+        for content in fi:
+            content=content.decode('utf-8')
+            if where is not None and not where.match(content):
+                continue
+            if compact:
+                yield _lineToRecord(content,header,cols)
             else:
-                tmp=content[2:].split('=')
-                if len(tmp)==2:
-                    meta[tmp[0]]=tmp[1]
-        elif content[0]=='#': # fields
-            fields=content[1:].split()
-        else: #data
-            if len(firstdataline)==0:
-                firstdataline=content
-            if getdata==True:
-                val=content.split()
-                dic={}
-                for j in range(9):
-                    dic[fields[j]]=val[j]
-                for i in range(9,len(val)):
-                    dic["sample"+str(i-8)]=fields[i]
-                    dic["data"+str(i-8)]=val[i]
-                dic["sample_size"]=len(val)-9
-                data.append(dic)
-    fi.close()
-    if len(form)==0:
-        i=fields.index('FORMAT')
-        val=firstdataline.split()
+                yield _lineToDict(content,header.fields,cols)
+
+# Function that returns the header to use for the data of the asked 'samples' (names or
+# zero-based positions) and the columns of these samples in a data line. If 'samples' is
+# None then the header itself and None (for all the columns) are returned
+def _selectSamples(header, samples):
+    if samples is None:
+        return header,None
+    cols=[]
+    for sample in samples:
+        if isinstance(sample,int):
+            if not 0<=sample<len(header.samples):
+                raise ValueError("There is no sample {} in file '{}'".format(sample,header.file))
+            cols.append(9+sample)
+        elif sample in header.sampleIndex:
+            cols.append(9+header.sampleIndex[sample])
+        else:
+            raise ValueError("Sample '{}' not found in file '{}'".format(sample,header.file))
+    sub=copy.copy(header)
+    sub.samples=[header.fields[c] for c in cols]
+    sub.sampleIndex={name:i for i,name in enumerate(sub.samples)}
+    sub.fields=header.fields[:9]+sub.samples
+    return sub,cols
+
+# Function that splits a data line keeping only the nine fixed columns and the columns 'cols'.
+# The line is split only up to the last of 'cols' ('sep' is the separator, None for whitespace)
+def _selectValues(content, cols, sep):
+    val=content.split(sep,max(cols,default=8)+1)
+    return val[:9]+[val[c] for c in cols]
+
+###############################################################################
+###                             VCFRecord                                   ###
+###############################################################################
+''' Class VCFRecord
+    A compact form of a data line, used instead of the dictionaries of 'read',
+    'iterRecords' and 'getData' when these are called with compact=True.
+    The nine fixed columns are kept as attributes (rec.CHROM, rec.POS, ... rec.FORMAT)
+    and the sample columns as a list of strings (rec.data). The sample names are
+    not repeated in every record; they are kept once in the shared VCFHeader.
+    The sample columns are kept as one unsplit string until they are first used,
+    so records that are checked only by their fixed columns cost almost nothing,
+    and a FORMAT sub-field of a sample is cut out of its column only when asked.
+        rec.sample_size        the number of samples
+        rec.sampleName(i)      the name of the i-th (zero-based) sample
+        rec.sample(name)       the data of the sample named 'name'
+        rec.sampleData()       a dictionary with all the 'sample_name':'value' pairs
+        rec.toDict()           the dictionary that 'read' would return for this line
+        rec.formatIndex(key)   the position of the sub-field 'key' (e.g. 'GT') in FORMAT (-1 if missing)
+        rec.formatValue(key, sample)
+                               the 'key' sub-field of a sample (given by name or zero-based position)
+        rec.formatValues(key)  the list of the 'key' sub-field of all samples
+                               (missing sub-fields are returned as '.')
+        rec.infoValue(key)     the value of the INFO key 'key', typed as in the header (see 'parseInfo'),
+                               None if the key is not in the INFO column
+        rec.toLine()           the data line of the record (tab separated, with '\n' at the end)
+    The records of sites-only lines (the eight columns up to INFO) have an empty
+    FORMAT ('') and no samples, and are written back with eight columns.
+    For compatibility with the dictionaries, rec['CHROM'], rec['sample_size'],
+    rec['sample3'] and rec['data3'] also work.
+'''
+class VCFRecord:
+    __slots__=('header','CHROM','POS','ID','REF','ALT','QUAL','FILTER','INFO','FORMAT','_raw','_data')
+
+    def __init__(self, header, val):
+        self.header=header
+        if len(val)<9: # sites-only line, without FORMAT and samples
+            val=list(val)+['']*(9-len(val))
+        self.CHROM,self.POS,self.ID,self.REF,self.ALT,self.QUAL,self.FILTER,self.INFO,self.FORMAT=val[:9]
+        if len(val)>10: # the sample columns are already split
+            self._raw=None
+            self._data=val[9:]
+        else: # the sample columns (if any) are kept as one string until they are needed
+            self._raw=val[9] if len(val)==10 else ''
+            self._data=None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data=self._raw.split('\t') if len(self._raw)>0 else []
+            self._raw=None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._raw=None
+        self._data=value
+
+    @property
+    def sample_size(self):
+        if self._data is None:
+            return self._raw.count('\t')+1 if len(self._raw)>0 else 0
+        return len(self._data)
+
+    def formatIndex(self, key):
+        return _layoutIndex(self.header,self.FORMAT,key)
+
+    def formatValue(self, key, sample):
+        k=_layoutIndex(self.header,self.FORMAT,key)
+        if k<0:
+            return '.'
+        if isinstance(sample,str):
+            sample=self.header.sampleIndex[sample]
+        return _subfield(self.data[sample],k)
+
+    def formatValues(self, key):
+        k=_layoutIndex(self.header,self.FORMAT,key)
+        if k<0:
+            return ['.']*self.sample_size
+        return [_subfield(cell,k) for cell in self.data]
+
+    def infoValue(self, key):
+        return parseInfo(self.INFO,self.header.infotypes,[key]).get(key)
+
+    def toLine(self):
+        if len(self.FORMAT)==0 and self.sample_size==0: # sites-only line
+            return '\t'.join((self.CHROM,self.POS,self.ID,self.REF,self.ALT,self.QUAL,self.FILTER,self.INFO))+'\n'
+        fixed='\t'.join((self.CHROM,self.POS,self.ID,self.REF,self.ALT,self.QUAL,self.FILTER,self.INFO,self.FORMAT))
+        if self._data is None: # the sample columns were never split, so they are written as read
+            return fixed+'\t'+self._raw+'\n' if len(self._raw)>0 else fixed+'\n'
+        return '\t'.join([fixed]+self._data)+'\n'
+
+    def sampleName(self, i):
+        return self.header.samples[i]
+
+    def sample(self, name):
+        return self.data[self.header.sampleIndex[name]]
+
+    def sampleData(self):
+        return dict(zip(self.header.samples,self.data))
+
+    def toDict(self):
         dic={}
-        for j in range(9):
-            dic[fields[j]]=val[j]
-        for i in range(9,len(val)):
-            dic["sample"+str(i-8)]=fields[i]
-            dic["data"+str(i-8)]=val[i]
-        dic["sample_size"]=len(val)-9
-        form=dic['FORMAT'].split(':')
-    return fields,meta,info,filt,form,data,fileformat
+        for j in range(min(9,len(self.header.fields))): # 8 fixed columns in sites-only files
+            dic[self.header.fields[j]]=getattr(self,pedia[j])
+        for i in range(len(self.data)):
+            dic["sample"+str(i+1)]=self.header.samples[i]
+            dic["data"+str(i+1)]=self.data[i]
+        dic["sample_size"]=len(self.data)
+        return dic
+
+    def __getitem__(self, key):
+        if key in pedia:
+            return getattr(self,key)
+        if key=='sample_size':
+            return len(self.data)
+        if key.startswith('sample') and key[6:].isdigit():
+            return self.header.samples[int(key[6:])-1]
+        if key.startswith('data') and key[4:].isdigit():
+            return self.data[int(key[4:])-1]
+        raise KeyError(key)
+
+# Function that converts a data line to a VCFRecord (the sample columns are not split)
+def _lineToRecord(content, header, cols=None):
+    if cols is not None:
+        return VCFRecord(header,_selectValues(content.rstrip('\r\n'),cols,'\t'))
+    return VCFRecord(header,content.rstrip('\r\n').split('\t',9))
+
+# Function that returns the position of 'key' in the FORMAT string 'form' (-1 if missing),
+# keeping the positions of each FORMAT string in the header, so each one is split once
+def _layoutIndex(header, form, key):
+    layout=header.layouts.get(form)
+    if layout is None:
+        layout={sub:k for k,sub in enumerate(form.split(':'))}
+        header.layouts[form]=layout
+    return layout.get(key,-1)
+
+# Function that returns the k-th (zero-based) ':'-separated sub-field of a sample column
+# without splitting all of it ('.' if the column has less sub-fields)
+def _subfield(cell, k):
+    start=0
+    for i in range(k):
+        start=cell.find(':',start)+1
+        if start==0:
+            return '.'
+    end=cell.find(':',start)
+    if end<0:
+        return cell[start:]
+    return cell[start:end]
+
+# Function that converts a data line to the dictionary used by 'read' and 'getData'
+def _lineToDict(content, fields, cols=None):
+    if cols is not None: # 'fields' are those of the header returned by '_selectSamples'
+        val=_selectValues(content,cols,None)
+    else:
+        val=content.split()
+    dic={}
+    for j in range(min(9,len(val))): # 8 fixed columns in sites-only lines
+        dic[fields[j]]=val[j]
+    for i in range(9,len(val)):
+        dic["sample"+str(i-8)]=fields[i]
+        dic["data"+str(i-8)]=val[i]
+    dic["sample_size"]=max(len(val)-9,0)
+    return dic
 
 ###############################################################################
-###                       functions based on 'read' function                ###
+###                             readHeader                                  ###
+###############################################################################
+''' Class VCFHeader
+    Keeps everything read from the header of a VCF file, that is the same
+    'fields', 'meta', 'info', 'filt', 'form' and 'fileformat' that 'read' returns,
+    together with the position of the first data line:
+        firstdataline: the (zero-based) line number of the first data line (-1 if no data)
+        dataoffset:    the byte offset of the first data line in the file (-1 if no data)
+        firstdata:     the content of the first data line ("" if no data)
+    and the sample names (the fields after FORMAT), kept once for all the records:
+        samples:       the list of the sample names
+        sampleIndex:   a dictionary with the (zero-based) position of each sample name in 'samples'
+        layouts:       the positions of the sub-fields of each FORMAT string met so far (used by VCFRecord)
+        infotypes:     the ('Type','Number') of each INFO key, from the '##INFO' lines (see 'infoTypes')
+        metalines:     the '##' lines of the file as they are (used by 'VCFWriter' to write the header)
+'''
+class VCFHeader:
+    def __init__(self, file=""):
+        self.file=file
+        self.fields=[]
+        self.meta={}
+        self.info=[]
+        self.filt=[]
+        self.form=[]
+        self.fileformat="unknown"
+        self.firstdataline=-1
+        self.dataoffset=-1
+        self.firstdata=""
+        self.samples=[]
+        self.sampleIndex={}
+        self.layouts={}
+        self.infotypes={}
+        self.metalines=[]
+
+''' Function readHeader
+    input:  file, the name of a file to read the header from
+    output: a VCFHeader object
+
+    Reads the meta-data lines and the '#CHROM' line of the file and stops at
+    the first data line (which is needed only when the file has no '##FORMAT'
+    lines, in which case 'form' is taken from the FORMAT column of that line).
+    The data section is never read, so the time needed does not depend on
+    the size of the file.
+    *************************** example ****************************
+    header = vcf.readHeader('some_file_name.txt')
+    print(header.fields, header.fileformat)
+'''
+def readHeader(file):
+    header=VCFHeader(file)
+    # check filename and if it is empty or does not exist return an empty header
+    if file=='' or not os.path.isfile(file):
+        print("File '{}' NOT found.".format(file))
+        return header
+    with _open(file) as fi:
+        offset=0
+        lineno=0
+        for raw in fi:
+            content=raw.decode('utf-8')
+            if content.endswith('\r\n'):
+                content=content[:-2]+'\n'
+            if content[0]=='#':
+                _parseHeaderLine(content,header)
+                if content[:2]=='##':
+                    header.metalines.append(content)
+            else: # first data line, so the header is over
+                header.firstdataline=lineno
+                header.dataoffset=offset
+                header.firstdata=content
+                break
+            offset+=len(raw)
+            lineno+=1
+    if len(header.form)==0 and 'FORMAT' in header.fields:
+        val=header.firstdata.split()
+        i=header.fields.index('FORMAT')
+        if len(val)>i:
+            header.form=val[i].split(':')
+    header.infotypes=infoTypes(header)
+    return header
+
+# Function that parses a header line (starting with '#') into the header object
+def _parseHeaderLine(content, header):
+    if content[:2]=='##': #meta-data
+        if content[2:6].upper()=='INFO':
+            header.info.append(_parseMetaDict(content[8:len(content)-2]))
+        elif content[2:8].upper()=='FILTER':
+            header.filt.append(_parseMetaDict(content[10:len(content)-2]))
+        elif content[2:8].upper()=='FORMAT':
+            header.form.append(_parseMetaDict(content[10:len(content)-2]))
+        elif content[2:12].upper()=='FILEFORMAT':
+            header.fileformat=content.split('=')[1].strip()
+        else:
+            tmp=content[2:].split('=')
+            if len(tmp)==2:
+                header.meta[tmp[0]]=tmp[1]
+    else: # fields
+        header.fields=content[1:].split()
+        header.samples=header.fields[9:]
+        header.sampleIndex={name:i for i,name in enumerate(header.samples)}
+
+# Function that parses the 'key=value,key=value' text of an INFO/FILTER/FORMAT line
+def _parseMetaDict(tmp):
+    tmp_list=tmp.split(',')
+    tmp_d={}
+    for ss in tmp_list:
+        ss2=ss.split('=')
+        if len(ss2)==2:
+            tmp_d[ss2[0]]=ss2[1]
+    return tmp_d
+
+###############################################################################
+###                  functions based on 'readHeader' function               ###
 ###############################################################################
 def getFields(file):
-    fields,meta,info,filt,form,data,fileformat = read(file, False)
-    return fields
+    return readHeader(file).fields
 
 def getMeta(file):
-    fields,meta,info,filt,form,data,fileformat = read(file, False)
-    return meta
+    return readHeader(file).meta
 
 def getInfo(file):
-    fields,meta,info,filt,form,data,fileformat = read(file, False)
-    return info
+    return readHeader(file).info
 
 def getFilter(file):
-    fields,meta,info,filt,form,data,fileformat = read(file, False)
-    return filt
+    return readHeader(file).filt
 
 def getFormat(file):
-    fields,meta,info,filt,form,data,fileformat = read(file, False)
-    return form
+    return readHeader(file).form
 
-def getData(file,startLine=0,num_of_lines=1):
+def getData(file,startLine=0,num_of_lines=1,useindex=False,compact=False,samples=None):
     lst=[]
     if startLine==0:
         print("You have to enter a line value {syntax: getData(filename, start_line_no, [number_of_lines])}")
@@ -235,48 +595,1380 @@ def getData(file,startLine=0,num_of_lines=1):
         print("For the moment an empty list of dictionaries is returned...")
         lst.append({})
         return lst
-    lineno=getFirstDataline(file)
-    fields = getFields(file)
-    with open(file) as lines:
-        for content in islice(lines, lineno+startLine-1, lineno+startLine-1+num_of_lines):
-            val=content.split()
-            dic={}
-            for j in range(9):
-                dic[fields[j]]=val[j]
-            for i in range(9,len(val)):
-                dic["sample"+str(i-8)]=fields[i]
-                dic["data"+str(i-8)]=val[i]
-            dic["sample_size"]=len(val)-9
-            lst.append(dic)
-        if len(lst)==0:
-            lst.append({})
+    header,cols=_selectSamples(readHeader(file),samples)
+    if header.dataoffset<0:
+        lst.append({})
         return lst
-    lst.append({})
+    offset,skip=_dataOffset(file,header,startLine,useindex)
+    if offset>=0:
+        with _open(file) as lines:
+            lines.seek(offset)
+            for content in islice(lines, skip, skip+num_of_lines):
+                if compact:
+                    lst.append(_lineToRecord(content.decode('utf-8'),header,cols))
+                else:
+                    lst.append(_lineToDict(content.decode('utf-8'),header.fields,cols))
+    if len(lst)==0:
+        lst.append({})
     return lst
 
+# Function that returns the byte offset from where to start reading and the number
+# of lines to skip after it, in order to reach the 'startLine' (1-based) data line
+def _dataOffset(file, header, startLine, useindex):
+    if not useindex:
+        return header.dataoffset,startLine-1
+    index=loadIndex(file)
+    k=(startLine-1)//index['step']
+    if k>=len(index['offsets']):
+        return -1,0
+    return index['offsets'][k],(startLine-1)%index['step']
+
 def getFirstDataline(file):
-    fi=open(file,'r')
-    i=0
-    for content in fi:
-        if not content[0]=='#':
-            fi.close()
-            return i
-        i+=1
-    fi.close()
-    return -1
+    return readHeader(file).firstdataline
 
 def getFileformat(file):
-    fields,meta,info,filt,form,data,fileformat = read(file, False)
-    return fileformat
+    return readHeader(file).fileformat
+
+def printSampleData(file, lineNo, useindex=False):
+    for name,value in getSampleData(file,lineNo,useindex).items():
+        print("{}: {}".format(name,value))
+
+def getSampleData(file, lineNo, useindex=False):
+    rec=getData(file,lineNo,useindex=useindex,compact=True)[0]
+    if not isinstance(rec,VCFRecord):
+        return {}
+    return rec.sampleData()
+
+###############################################################################
+###                             line index                                  ###
+###############################################################################
+''' Function buildIndex
+    input:  file, the name of a file to index
+            step, every how many data lines an offset is kept (default 1000)
+    output: the index, a dictionary with keys 'size', 'mtime', 'step', 'lines', 'offsets'
+
+    Reads the data section of the file once and keeps the byte offset of the
+    data lines 1, step+1, 2*step+1, ... in 'offsets' ('lines' is the number of
+    data lines). The index is saved next to the file (file name + '.vidx')
+    together with the size and the modification time of the file, so that
+    'loadIndex' reuses it until the file changes.
+    Functions 'getData', 'getSampleData' and 'printSampleData' use the index
+    when called with useindex=True, seeking near the wanted line instead of
+    reading the file from the start.
+'''
+def buildIndex(file, step=1000):
+    header=readHeader(file)
+    st=os.stat(file)
+    index={'size':st.st_size, 'mtime':st.st_mtime_ns, 'step':step, 'lines':0, 'offsets':[]}
+    if header.dataoffset>=0:
+        offsets=index['offsets']
+        offset=header.dataoffset
+        lines=0
+        with _open(file) as fi:
+            fi.seek(offset)
+            for content in fi:
+                if lines%step==0:
+                    offsets.append(offset)
+                offset+=len(content)
+                lines+=1
+        index['lines']=lines
+    try:
+        with open(file+index_ext,'w') as fo:
+            json.dump(index,fo)
+    except OSError:
+        print("Index file '{}' could not be written.".format(file+index_ext))
+    _indexes[file]=index
+    return index
+
+''' Function loadIndex
+    input:  file, the name of an indexed file
+            step, used only if the index has to be built (default 1000)
+    output: the index (see 'buildIndex')
+
+    Returns the index of the file, loading it from the '.vidx' file if it is
+    still valid (same size and modification time), else building it again.
+'''
+def loadIndex(file, step=1000):
+    st=os.stat(file)
+    index=_indexes.get(file)
+    if index is None and os.path.isfile(file+index_ext):
+        try:
+            with open(file+index_ext) as fi:
+                index=json.load(fi)
+        except (OSError, ValueError):
+            index=None
+    if index is None or index['size']!=st.st_size or index['mtime']!=st.st_mtime_ns:
+        return buildIndex(file, step)
+    _indexes[file]=index
+    return index
+
+###############################################################################
+###                              VCFFile                                    ###
+###############################################################################
+''' Class VCFFile
+    An open VCF file, for many queries on the same file. The file is opened and
+    its header is read once, and the line index (see 'buildIndex') is loaded once,
+    so each query only seeks to the wanted line instead of reading the file again.
+        vcf_file = vcf.VCFFile('some_file_name.txt', useindex=True)
+        vcf_file.header              the VCFHeader of the file
+        vcf_file.data(line)          the dictionary of the 'line' (1-based) data line
+                                     ({} if there is no such line), as in 'getData'.
+                                     With compact=True a VCFRecord (or None) is returned
+        vcf_file.sampleData(line)    the 'sample_name':'value' pairs of the 'line' data line,
+                                     as in 'getSampleData'
+        vcf_file.sample(name, line)  the value of the sample 'name' in the 'line' data line
+        vcf_file.close()             closes the file (or use it in a 'with' statement)
+    Lines asked in increasing order are read one after the other without seeking.
+    *************************** example ****************************
+    with vcf.VCFFile('cohort_225.vcf') as vcf_file:
+        for line in range(1000,1500):
+            print(vcf_file.sample('NA00001',line))
+'''
+class VCFFile:
+    def __init__(self, file, useindex=True):
+        self.file=file
+        self.header=readHeader(file)
+        self.index=None
+        self._fi=None
+        self._next=0 # the data line that the file is positioned at (0 if unknown)
+        if self.header.dataoffset>=0:
+            if useindex:
+                self.index=loadIndex(file)
+            self._fi=_open(file)
 
-def printSampleData(file, lineNo):
-    data=getData(file,lineNo)
-    for i in range(1,data[0]['sample_size']+1):
-        print("{}: {}".format(data[0]['sample'+str(i)],data[0]['data'+str(i)]))
+    def __enter__(self):
+        return self
 
-def getSampleData(file, lineNo):
-    data=getData(file,lineNo)
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._fi is not None:
+            self._fi.close()
+            self._fi=None
+
+    def data(self, line, compact=False):
+        content=self._readLine(line)
+        if content is None:
+            return None if compact else {}
+        if compact:
+            return _lineToRecord(content,self.header)
+        return _lineToDict(content,self.header.fields)
+
+    def sampleData(self, line):
+        rec=self.data(line,compact=True)
+        if rec is None:
+            return {}
+        return rec.sampleData()
+
+    def sample(self, name, line):
+        rec=self.data(line,compact=True)
+        if rec is None:
+            return None
+        return rec.data[self.header.sampleIndex[name]]
+
+    # reads the 'line' (1-based) data line, seeking only if it is not ahead of the current position
+    def _readLine(self, line):
+        if self._fi is None or line<1:
+            return None
+        if self.index is not None:
+            k=(line-1)//self.index['step']
+            if k>=len(self.index['offsets']):
+                return None
+            first=k*self.index['step']+1 # the data line at offsets[k]
+            if not first<=self._next<=line:
+                self._fi.seek(self.index['offsets'][k])
+                self._next=first
+        elif not 1<=self._next<=line:
+            self._fi.seek(self.header.dataoffset)
+            self._next=1
+        for content in self._fi:
+            self._next+=1
+            if self._next>line:
+                return content.decode('utf-8')
+        self._next=0
+        return None
+
+###############################################################################
+###                              INFO column                                ###
+###############################################################################
+''' Function infoTypes
+    input:  header, a VCFHeader (or the 'info' list returned by 'read')
+    output: a dictionary with the ('Type','Number') of each INFO key
+
+    Keys that are not declared in the header are taken as ('String','1').
+    *************************** example ****************************
+    vcf.infoTypes(vcf.readHeader('some_file_name.txt'))
+    {'NS': ('Integer', '1'), 'DP': ('Integer', '1'), 'AF': ('Float', 'A'), 'AA': ('String', '1'),
+     'DB': ('Flag', '0'), 'H2': ('Flag', '0')}
+'''
+def infoTypes(header):
+    info=header.info if isinstance(header,VCFHeader) else header
+    types={}
+    for dic in info:
+        if 'ID' in dic:
+            types[dic['ID']]=(dic.get('Type','String'),dic.get('Number','1'))
+    return types
+
+''' Function parseInfo
+    input:  info, the text of an INFO column (e.g. 'NS=3;DP=14;AF=0.5,0.2;DB')
+            types, the INFO types (see 'infoTypes')
+            keys, the list of the keys to return (default None, for all the keys)
+    output: a dictionary with the typed values of the keys found in 'info'
+
+    Flags are returned as True, Integer and Float values as int and float
+    ('.' as None), and String values as they are. Keys with Number=1 get a
+    single value, all the others get a list of values.
+    *************************** example ****************************
+    vcf.parseInfo('NS=3;DP=14;AF=0.5,0.2;DB', types)
+    {'NS': 3, 'DP': 14, 'AF': [0.5, 0.2], 'DB': True}
+'''
+def parseInfo(info, types, keys=None):
     dic={}
-    for i in range(1,data[0]['sample_size']+1):
-        dic[data[0]['sample'+str(i)]]=data[0]['data'+str(i)]
-    return dic
\ No newline at end of file
+    for item in info.rstrip('\r\n').split(';'): # INFO is the last column of sites-only lines
+        key,eq,value=item.partition('=')
+        if keys is not None and key not in keys:
+            continue
+        typ,number=types.get(key,('String','1'))
+        if typ=='Flag' or not eq:
+            dic[key]=True
+            continue
+        conv=_infoConverters.get(typ)
+        values=value.split(',')
+        if conv is not None:
+            values=[None if v=='.' or v=='' else conv(v) for v in values]
+        dic[key]=values[0] if number=='1' else values
+    return dic
+
+_infoConverters={'Integer':int, 'Float':float}
+
+''' Function loadInfo
+    input:  file, the name of a file to read the data from
+            keys, the list of the INFO keys to load (e.g. ['DP','AF','AA'])
+            width, how many values are kept for keys with more than one value (default 1)
+            chunk, the number of data lines converted to arrays at once (default 100000)
+    output: a dictionary of NumPy arrays, one for each key, plus 'CHROM' and 'POS'
+
+    Reads the file once and keeps only the asked INFO keys, typed by the '##INFO'
+    lines of the header: Integer keys in int32 arrays (MISSING (-1) for missing
+    values), Float keys in float64 arrays (nan for missing), Flag keys in bool
+    arrays and String keys in string arrays ('.' for missing). For keys with
+    Number other than 1 (e.g. AF) the first 'width' values are kept, in arrays
+    of 'width' columns if width>1.
+    NumPy is needed only for this function.
+    *************************** example ****************************
+    info = vcf.loadInfo('cohort_225.vcf', ['DP','AF','AA'])
+    print(info['POS'][info['DP']>100])
+'''
+def loadInfo(file, keys, width=1, chunk=100000):
+    import numpy as np
+    header=readHeader(file)
+    types=[header.infotypes.get(key,('String','1')) for key in keys]
+    wanted={key:i for i,key in enumerate(keys)}
+    columns=[[] for key in keys] # the arrays of each key (one for each chunk)
+    values=[[] for key in keys]  # the (text) values of each key in the current chunk
+    chroms=[]
+    poss=[]
+    if header.dataoffset>=0:
+        for content in _iterLines(file,header.dataoffset,None):
+            val=content.decode('utf-8').rstrip('\r\n').split('\t',8)
+            chroms.append(val[0])
+            poss.append(int(val[1]))
+            found=[None]*len(keys)
+            for item in val[7].split(';'):
+                key,eq,value=item.partition('=')
+                i=wanted.get(key)
+                if i is not None:
+                    found[i]=value if eq else True
+            for i in range(len(keys)):
+                values[i].append(found[i])
+            if len(values[0])==chunk:
+                for i in range(len(keys)):
+                    columns[i].append(_infoArray(np,values[i],types[i],width))
+                    values[i]=[]
+    result={}
+    for i,key in enumerate(keys):
+        columns[i].append(_infoArray(np,values[i],types[i],width))
+        result[key]=np.concatenate(columns[i])
+    result['CHROM']=np.array(chroms)
+    result['POS']=np.array(poss,dtype=np.int64)
+    return result
+
+# Function that converts the text values of an INFO key (None where the key is missing)
+# to a NumPy array of its type
+def _infoArray(np, values, typ, width):
+    typ,number=typ
+    if typ=='Flag':
+        return np.array([v is not None for v in values],dtype=bool)
+    if typ=='Integer':
+        missing,dtype=str(MISSING),np.int32
+    elif typ=='Float':
+        missing,dtype='nan',np.float64
+    else:
+        missing,dtype='.',str
+    if number=='1' or width==1:
+        text=[missing if v is None or v is True else v.partition(',')[0] for v in values]
+    else:
+        text=[]
+        for v in values:
+            sub=v.split(',')[:width] if v is not None and v is not True else []
+            text.extend(sub+[missing]*(width-len(sub)))
+    text=[missing if v=='.' or v=='' else v for v in text]
+    array=np.array(text,dtype=str)
+    if dtype is not str:
+        array=array.astype(dtype)
+    if number!='1' and width>1:
+        array=array.reshape(len(values),width)
+    return array
+
+###############################################################################
+###                             record filters                              ###
+###############################################################################
+''' Function compileFilter
+    input:  expr, a filter expression (or an already compiled RecordFilter, or None)
+    output: a RecordFilter (None if expr is None)
+
+    The expression is a list of conditions joined by '&&', all of which must hold.
+    Each condition is 'FIELD OPERATOR VALUE' with OPERATOR one of == != > >= < <=
+    and FIELD one of:
+        CHROM, ID, REF, ALT, FILTER   compared as text
+        POS, QUAL                     compared as numbers (QUAL '.' fails every condition)
+        N_ALT                         the number of ALT alleles (0 for '.')
+        INFO/KEY                      the value of the INFO key KEY, compared as a number if
+                                      VALUE is a number, else as text. A key that is missing
+                                      fails every condition. 'INFO/KEY' alone (without operator
+                                      and value) checks that the key (e.g. a Flag) is present.
+    The conditions are checked in order of cost (text columns first, then numbers,
+    then INFO), so most rejected lines are rejected before the INFO column is split,
+    and the sample columns of a rejected line are never split.
+    All the readers of this module accept the expression (as 'where' argument) directly.
+    *************************** example ****************************
+    where = vcf.compileFilter('FILTER==PASS && QUAL>=30 && N_ALT==1 && INFO/DP>10')
+    for rec in vcf.iterRecords('cohort_225.vcf', compact=True, where=where):
+        print(rec.CHROM,rec.POS)
+'''
+def compileFilter(expr):
+    if expr is None or isinstance(expr,RecordFilter):
+        return expr
+    return RecordFilter(expr)
+
+''' Class RecordFilter
+    A compiled filter expression (see 'compileFilter').
+        where.match(line)   True if the data line (text) passes the filter
+        where.expr          the expression
+'''
+class RecordFilter:
+    def __init__(self, expr):
+        self.expr=expr
+        terms=[]
+        for cond in expr.split('&&'):
+            cond=cond.strip()
+            if len(cond)>0:
+                terms.append(_parseCondition(cond,expr))
+        terms.sort(key=lambda term: term[0])
+        self.terms=terms
+
+    def match(self, line):
+        val=line.rstrip('\r\n').split('\t',8) # INFO is the last column of sites-only lines
+        info=None
+        for cost,kind,key,op,value in self.terms:
+            if kind=='text':
+                if not op(val[key],value):
+                    return False
+            elif kind=='number':
+                x=val[key]
+                if x=='.' or not op(float(x),value):
+                    return False
+            elif kind=='nalt':
+                x=0 if val[4]=='.' else val[4].count(',')+1
+                if not op(x,value):
+                    return False
+            else: # INFO key
+                if info is None:
+                    info={}
+                    for item in val[7].split(';'):
+                        k,eq,v=item.partition('=')
+                        info[k]=v
+                x=info.get(key)
+                if x is None:
+                    return False
+                if op is None:
+                    continue
+                if isinstance(value,float):
+                    try:
+                        x=float(x.partition(',')[0])
+                    except ValueError:
+                        return False
+                if not op(x,value):
+                    return False
+        return True
+
+_filterOperators=[('==',operator.eq),('!=',operator.ne),('>=',operator.ge),('<=',operator.le),
+                  ('>',operator.gt),('<',operator.lt)]
+
+# Function that parses a condition of a filter expression to a tuple (cost, kind, key, operator, value)
+def _parseCondition(cond, expr):
+    for text,op in _filterOperators:
+        if text in cond:
+            field,value=cond.split(text,1)
+            field=field.strip()
+            value=value.strip().strip('"\'')
+            break
+    else: # no operator: only INFO/KEY is allowed
+        field,op,value=cond,None,None
+    if field.upper().startswith('INFO/'):
+        if value is not None:
+            try:
+                value=float(value)
+            except ValueError:
+                pass
+        return (3,'info',field[5:],op,value)
+    field=field.upper()
+    if op is None:
+        raise ValueError("Condition '{}' of filter '{}' has no operator".format(cond,expr))
+    if field in ('POS','QUAL'):
+        return (2,'number',pedia.index(field),op,float(value))
+    if field=='N_ALT':
+        return (1,'nalt',4,op,int(value))
+    if field in ('CHROM','ID','REF','ALT','FILTER'):
+        return (0,'text',pedia.index(field),op,value)
+    raise ValueError("Unknown field '{}' in filter '{}'".format(field,expr))
+
+###############################################################################
+###                           loadGenotypes                                 ###
+###############################################################################
+''' Function loadGenotypes
+    input:  file, the name of a file to read the data from
+            formats, the FORMAT sub-fields to load (default ('GT','DP','GQ'))
+            ploidy, the number of alleles kept for each GT call (default 2)
+            chunk, the number of data lines (sites) of each allocated block (default 10000)
+            workers, the number of processes that read the file in parallel (default 1)
+            fixed, the fixed columns to load (default ('CHROM','POS'))
+            cache, if True the arrays are saved in (or loaded from) the cache of the file
+            samples, the names or (zero-based) positions of the samples to load (default None, for all)
+            where, a filter expression (see 'compileFilter'); only the sites that pass it are loaded
+    output: a dictionary of NumPy arrays
+
+    Reads the file line by line and fills NumPy arrays with the calls of all
+    the samples (sites x samples), so that a big cohort is kept in a few
+    arrays instead of millions of Python strings. The arrays are allocated
+    in blocks of 'chunk' sites, so the file is read only once.
+    The returned dictionary contains:
+        'samples':  the list of the sample names
+        'CHROM':    array of the CHROM of each site (strings)
+        'POS':      array of the POS of each site (int64)
+                    (and any other fixed column asked in 'fixed': QUAL as float64 with nan for '.',
+                    the rest as strings)
+        'GT':       int8 array (sites x samples x ploidy) with the allele codes of each call
+                    (e.g. '0/1' -> [0,1], '1' -> [1,-1]). Missing alleles are set to MISSING (-1)
+        'DP', 'GQ' (and any other integer sub-field asked in 'formats'):
+                    int32 array (sites x samples). Missing values are set to MISSING (-1)
+    With workers>1 the data section is split in byte ranges (see 'iterBatches')
+    that are loaded by a pool of processes and joined in file order.
+    With cache=True the first call saves the arrays as '.npy' files in the folder
+    file name + '.vcache' (with a 'manifest.json' keeping the path, size and
+    modification time of the file) and the next calls load them from there as
+    memory-mapped (read-only) arrays, which is almost instant and shares the
+    memory between processes. Each combination of 'samples', 'where' and 'ploidy'
+    has its own sub-folder, so calls with different arguments do not replace each
+    other's arrays. The cache is written again when the file changes or when arrays
+    that it does not hold are asked. Arrays are never rewritten in place: every write
+    goes to new files and the manifest is replaced last, so arrays that are already
+    memory-mapped (by this or another process) stay valid.
+    NumPy is needed only for this function.
+    *************************** example ****************************
+    gen = vcf.loadGenotypes('cohort_225.vcf', formats=('GT','DP'))
+    print(gen['GT'].shape, (gen['DP']>10).sum(axis=1))
+'''
+def loadGenotypes(file, formats=('GT','DP','GQ'), ploidy=2, chunk=10000, workers=1, fixed=('CHROM','POS'), cache=False, samples=None, where=None):
+    import numpy as np
+    header,cols=_selectSamples(readHeader(file),samples)
+    where=compileFilter(where)
+    if cache:
+        result=_loadCache(np,file,formats,ploidy,fixed,header.samples,where)
+        if result is not None:
+            return result
+    ns=len(header.samples)
+    if header.dataoffset<0:
+        parts=[]
+    elif workers>1 and not _isGzip(file):
+        tasks=[(file,start,end,formats,ploidy,chunk,ns,fixed,cols,where) for start,end in _byteRanges(file,header.dataoffset,workers*4)]
+        with multiprocessing.Pool(workers) as pool:
+            parts=pool.map(_genotypeRange,tasks)
+    else:
+        parts=[_genotypeRange((file,header.dataoffset,None,formats,ploidy,chunk,ns,fixed,cols,where))]
+    result={'samples':header.samples}
+    sites=sum(part['sites'] for part in parts)
+    for key in formats:
+        result[key]=np.concatenate([part[key] for part in parts]) if len(parts)>0 else _newGenotypeBlock(np,[key],0,ns,ploidy)[key]
+        if key=='GT':
+            result[key]=result[key].reshape(sites,ns,ploidy)
+    for name in fixed:
+        result[name]=_fixedArray(np,name,[value for part in parts for value in part[name]])
+    if cache:
+        _saveCache(np,file,result,formats,ploidy,fixed,where)
+    return result
+
+# Function that converts the values of a fixed column to a NumPy array
+# (POS to int64, QUAL to float64 with nan for '.', the others to strings)
+def _fixedArray(np, name, values):
+    if name=='POS':
+        return np.array(values,dtype=np.int64)
+    if name=='QUAL':
+        return np.array(['nan' if v=='.' else v for v in values],dtype=str).astype(np.float64)
+    return np.array(values,dtype=str)
+
+# Function that loads the genotypes of the data lines starting between the byte offsets
+# 'start' and 'end' (end=None for the end of the file). It gets a tuple with all the
+# arguments, so it can be run by a multiprocessing pool
+def _genotypeRange(args):
+    import numpy as np
+    file,start,end,formats,ploidy,chunk,ns,fixed,cols,where=args
+    blocks=[] # the filled blocks of arrays
+    block=_newGenotypeBlock(np,formats,chunk,ns,ploidy)
+    columns=[(name,pedia.index(name),[]) for name in fixed] # the values of the fixed columns
+    sites=0
+    layouts={} # FORMAT string -> position of each one of 'formats' in it
+    gtcodes={} # GT string -> allele codes
+    missing=str(MISSING)
+    row=0
+    for content in _iterLines(file,start,end):
+        content=content.decode('utf-8')
+        if where is not None and not where.match(content):
+            continue
+        if cols is None:
+            val=content.split()
+        else:
+            val=_selectValues(content,cols,None)
+        if row==chunk: # the block is full, so keep it and allocate the next one
+            blocks.append(block)
+            block=_newGenotypeBlock(np,formats,chunk,ns,ploidy)
+            row=0
+        for name,j,values in columns:
+            values.append(val[j])
+        sites+=1
+        form=val[8] if len(val)>8 else '' # a line without FORMAT has none of the sub-fields
+        layout=layouts.get(form)
+        if layout is None:
+            layout=_formatLayout(form,formats)
+            layouts[form]=layout
+        cells=[cell.split(':') for cell in val[9:]]
+        for key,k in zip(formats,layout):
+            if k<0:
+                continue
+            values=[cell[k] if k<len(cell) else '.' for cell in cells]
+            if key=='GT':
+                codes=[]
+                for gt in values:
+                    code=gtcodes.get(gt)
+                    if code is None:
+                        code=_gtCodes(gt,ploidy)
+                        gtcodes[gt]=code
+                    codes.extend(code)
+                block[key][row]=codes
+            else: # NumPy converts the strings to integers when the row is assigned
+                block[key][row]=[missing if v=='.' or v=='' else v for v in values]
+        row+=1
+    blocks.append({key:block[key][:row] for key in formats})
+    part={key:np.concatenate([b[key] for b in blocks]) for key in formats}
+    for name,j,values in columns:
+        part[name]=values
+    part['sites']=sites
+    return part
+
+# Function that returns the arrays of 'loadGenotypes' from the cache of the file, or None
+# if there is no valid cache (the file has changed) or it does not hold all the asked arrays
+def _loadCache(np, file, formats, ploidy, fixed, samples, where):
+    folder=_cacheFolder(file,samples,where,ploidy)
+    manifest=_readManifest(folder)
+    if manifest is None or not _cacheValid(manifest,file,samples,where,ploidy):
+        return None
+    arrays=manifest['arrays']
+    names=list(formats)+list(fixed)
+    if not all(name in arrays for name in names):
+        return None
+    result={'samples':manifest['samples']}
+    try:
+        for name in names:
+            result[name]=np.load(os.path.join(folder,arrays[name]),mmap_mode='r')
+    except (OSError, ValueError): # the arrays were replaced by another process meanwhile
+        return None
+    return result
+
+# Function that saves the arrays of 'loadGenotypes' in the cache of the file. Each array is
+# written to a new file (never over a file that may be memory-mapped) and the manifest, which
+# names the files of the arrays, is replaced last. Arrays of other sub-fields already cached
+# for the same file are kept
+def _saveCache(np, file, result, formats, ploidy, fixed, where):
+    samples=result['samples']
+    folder=_cacheFolder(file,samples,where,ploidy)
+    st=os.stat(file)
+    arrays={}
+    old=_readManifest(folder)
+    if old is not None and _cacheValid(old,file,samples,where,ploidy):
+        arrays.update(old['arrays'])
+    token=uuid.uuid4().hex[:12]
+    manifestfile=os.path.join(folder,'manifest.json')
+    try:
+        os.makedirs(folder,exist_ok=True)
+        for name in list(formats)+list(fixed):
+            arrayfile=name+'.'+token+'.npy'
+            path=os.path.join(folder,arrayfile)
+            with open(path+'.tmp','wb') as fo:
+                np.save(fo,result[name])
+            os.replace(path+'.tmp',path)
+            arrays[name]=arrayfile
+        manifest={'file':os.path.abspath(file), 'size':st.st_size, 'mtime':st.st_mtime_ns, 'ploidy':ploidy,
+                  'samples':samples, 'where':where.expr if where is not None else None, 'arrays':arrays}
+        with open(manifestfile+'.'+token+'.tmp','w') as fo:
+            json.dump(manifest,fo)
+        os.replace(manifestfile+'.'+token+'.tmp',manifestfile)
+    except OSError:
+        print("Cache '{}' could not be written.".format(folder))
+        return
+    _cleanCache(folder)
+
+# Function that returns the cache sub-folder of the arrays loaded with the given samples,
+# filter and ploidy (a hash of them under the file name + '.vcache' folder)
+def _cacheFolder(file, samples, where, ploidy):
+    key=json.dumps([samples,where.expr if where is not None else None,ploidy])
+    return os.path.join(file+cache_ext,hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+# Function that reads the manifest of a cache sub-folder (None if there is none)
+def _readManifest(folder):
+    try:
+        with open(os.path.join(folder,'manifest.json')) as fi:
+            manifest=json.load(fi)
+    except (OSError, ValueError):
+        return None
+    return manifest if 'arrays' in manifest else None
+
+# Function that checks that a manifest was written for the current state of the file
+# and for the same samples, filter and ploidy
+def _cacheValid(manifest, file, samples, where, ploidy):
+    st=os.stat(file)
+    return manifest['size']==st.st_size and manifest['mtime']==st.st_mtime_ns and \
+           manifest['ploidy']==ploidy and manifest['samples']==samples and \
+           manifest['where']==(where.expr if where is not None else None)
+
+# Function that removes the array files of a cache sub-folder that its manifest no more names.
+# Files that can not be removed (e.g. memory-mapped on Windows) are left for a later call
+def _cleanCache(folder):
+    manifest=_readManifest(folder)
+    if manifest is None:
+        return
+    keep=set(manifest['arrays'].values())
+    for name in os.listdir(folder):
+        if name.endswith('.npy') and name not in keep:
+            try:
+                os.remove(os.path.join(folder,name))
+            except OSError:
+                pass
+
+# Function that allocates a block of arrays for 'loadGenotypes'
+def _newGenotypeBlock(np, formats, chunk, ns, ploidy):
+    block={}
+    for key in formats:
+        if key=='GT': # kept flat (sites x samples*ploidy) while loading
+            block[key]=np.full((chunk,ns*ploidy),MISSING,dtype=np.int8)
+        else:
+            block[key]=np.full((chunk,ns),MISSING,dtype=np.int32)
+    return block
+
+# Function that returns the position of each one of 'keys' in a FORMAT string (-1 if missing)
+def _formatLayout(form, keys):
+    sub=form.split(':')
+    return tuple(sub.index(key) if key in sub else -1 for key in keys)
+
+# Function that converts a GT string (e.g. '0/1', '1|0', '1', './.') to 'ploidy' allele codes
+def _gtCodes(gt, ploidy):
+    codes=[MISSING]*ploidy
+    for i,allele in enumerate(gt.replace('|','/').split('/')[:ploidy]):
+        if allele.isdigit():
+            codes[i]=int(allele)
+    return tuple(codes)
+
+
+###############################################################################
+###                     compressed files (gzip / BGZF)                      ###
+###############################################################################
+# Function that opens a file for (binary) reading. Files compressed with gzip or
+# bgzip are decompressed on the fly, so all the functions of this module accept
+# '.vcf.gz' files too. Note that the byte offsets (e.g. header.dataoffset and the
+# line index of 'buildIndex') are then positions in the decompressed data.
+def _open(file):
+    if _isGzip(file):
+        return gzip.open(file,'rb')
+    return open(file,'rb')
+
+# Function that tells if the file is compressed with gzip (or bgzip)
+def _isGzip(file):
+    with open(file,'rb') as fi:
+        return fi.read(2)==b'\x1f\x8b'
+
+# Function that tells if the file is compressed with bgzip (blocked gzip)
+def _isBgzf(file):
+    with open(file,'rb') as fi:
+        head=fi.read(18)
+    return len(head)==18 and head[:2]==b'\x1f\x8b' and head[3]&4!=0 and head[12:14]==b'BC'
+
+# Generator that reads the BGZF blocks from the current position of the (raw) file 'fi'
+# and yields the offset of each block in the compressed file together with its decompressed data
+def _bgzfBlocks(fi):
+    while True:
+        coffset=fi.tell()
+        head=fi.read(12)
+        if len(head)<12:
+            return
+        xlen=struct.unpack('<H',head[10:12])[0]
+        extra=fi.read(xlen)
+        bsize=-1
+        i=0
+        while i+4<=len(extra): # find the 'BC' sub-field that holds the size of the block
+            slen=struct.unpack('<H',extra[i+2:i+4])[0]
+            if extra[i:i+2]==b'BC':
+                bsize=struct.unpack('<H',extra[i+4:i+6])[0]
+            i+=4+slen
+        if head[:2]!=b'\x1f\x8b' or bsize<0:
+            raise ValueError("File '{}' is not a valid BGZF file".format(fi.name))
+        cdata=fi.read(bsize-xlen-19)
+        fi.read(8) # CRC32 and ISIZE
+        yield coffset,zlib.decompress(cdata,-15)
+
+# Generator that yields the lines of a BGZF file starting from the line at 'uoffset'
+# of the (decompressed) block found at 'coffset' of the compressed file
+def _bgzfLines(file, coffset, uoffset):
+    with open(file,'rb') as fi:
+        fi.seek(coffset)
+        rest=b''
+        for coff,data in _bgzfBlocks(fi):
+            if coff==coffset:
+                data=data[uoffset:]
+            lines=(rest+data).split(b'\n')
+            rest=lines.pop()
+            for line in lines:
+                yield line+b'\n'
+        if rest:
+            yield rest
+
+''' Function buildBgzfIndex
+    input:  file, the name of a VCF file compressed with bgzip
+    output: the index, a dictionary with keys 'size', 'mtime', 'chroms'
+
+    Reads the file once and keeps, for every CHROM, the position (compressed
+    offset of the block and offset inside the decompressed block) of its first
+    data line, and the POS and position of the first data line that starts in
+    each block. The data must be sorted by POS inside each CHROM.
+    The index is saved next to the file (file name + '.vbi') together with the
+    size and the modification time of the file, so it is reused by 'query'
+    until the file changes.
+'''
+def buildBgzfIndex(file):
+    st=os.stat(file)
+    chroms={} # CHROM -> {'start':[coffset,uoffset], 'pos':[...], 'coffset':[...], 'uoffset':[...]}
+    with open(file,'rb') as fi:
+        rest=b''   # the part of a line that continues in the next block
+        pending=None # position of the line in 'rest' if it is the first that starts in its block
+        for coffset,data in _bgzfBlocks(fi):
+            start=0
+            if len(rest)>0 or pending is not None:
+                nl=data.find(b'\n')
+                if nl<0:
+                    rest+=data
+                    continue
+                _indexLine(chroms,rest+data[:nl],pending)
+                rest=b''
+                pending=None
+                start=nl+1
+            first=True
+            while start<len(data):
+                nl=data.find(b'\n',start)
+                if nl<0:
+                    rest=data[start:]
+                    pending=(coffset,start,first)
+                    break
+                _indexLine(chroms,data[start:nl],(coffset,start,first))
+                first=False
+                start=nl+1
+        if len(rest)>0:
+            _indexLine(chroms,rest,pending)
+    index={'size':st.st_size, 'mtime':st.st_mtime_ns, 'chroms':chroms}
+    try:
+        with open(file+bgzf_index_ext,'w') as fo:
+            json.dump(index,fo)
+    except OSError:
+        print("Index file '{}' could not be written.".format(file+bgzf_index_ext))
+    _bgzfindexes[file]=index
+    return index
+
+# Function that adds a line found at position 'where' (coffset, uoffset, first line of the block)
+# to the BGZF index 'chroms' (header lines are ignored)
+def _indexLine(chroms, line, where):
+    if where is None or line[:1]==b'#' or len(line.strip())==0:
+        return
+    val=line.split(b'\t',2)
+    chrom=val[0].decode('utf-8')
+    ch=chroms.get(chrom)
+    if ch is None:
+        ch={'start':[where[0],where[1]], 'pos':[], 'coffset':[], 'uoffset':[]}
+        chroms[chrom]=ch
+    elif not where[2]:
+        return
+    ch['pos'].append(int(val[1]))
+    ch['coffset'].append(where[0])
+    ch['uoffset'].append(where[1])
+
+''' Function loadBgzfIndex
+    input:  file, the name of a VCF file compressed with bgzip
+    output: the index (see 'buildBgzfIndex')
+
+    Returns the BGZF index of the file, loading it from the '.vbi' file if it
+    is still valid (same size and modification time), else building it again.
+'''
+def loadBgzfIndex(file):
+    st=os.stat(file)
+    index=_bgzfindexes.get(file)
+    if index is None and os.path.isfile(file+bgzf_index_ext):
+        try:
+            with open(file+bgzf_index_ext) as fi:
+                index=json.load(fi)
+        except (OSError, ValueError):
+            index=None
+    if index is None or index['size']!=st.st_size or index['mtime']!=st.st_mtime_ns:
+        return buildBgzfIndex(file)
+    _bgzfindexes[file]=index
+    return index
+
+###############################################################################
+###                                 query                                   ###
+###############################################################################
+''' Function query
+    input:  file, the name of a file to read the data from
+            chrom, the CHROM of the region
+            start, end, the first and last POS of the region (1-based, both included)
+            compact, if True VCFRecords are yielded instead of dictionaries
+    output: a generator that yields the data lines of the region
+
+    For files compressed with bgzip the BGZF index (see 'buildBgzfIndex') is
+    used (built at the first call) so only the blocks covering the region are
+    decompressed. For uncompressed files the position index (see 'buildPosIndex')
+    is used (built at the first call), so only the lines of the region are read.
+    For files compressed with gzip all the data lines are read.
+    *************************** example ****************************
+    for dic in vcf.query('cohort_225.vcf.gz', 'Bgt_chr-05', 1200000, 1300000):
+        print(dic['POS'],dic['REF'],dic['ALT'])
+'''
+def query(file, chrom, start, end, compact=False):
+    header=readHeader(file)
+    if header.dataoffset<0:
+        return
+    if _isBgzf(file):
+        ch=loadBgzfIndex(file)['chroms'].get(chrom)
+        if ch is None:
+            return
+        i=bisect_left(ch['pos'],start)
+        # the lines before an indexed line with POS<start are all before the region
+        if i>0:
+            lines=_bgzfLines(file,ch['coffset'][i-1],ch['uoffset'][i-1])
+        else:
+            lines=_bgzfLines(file,ch['start'][0],ch['start'][1])
+    elif _isGzip(file):
+        lines=_open(file)
+        lines.seek(header.dataoffset)
+    else:
+        ch=loadPosIndex(file)['chroms'].get(chrom)
+        if ch is None:
+            return
+        i=bisect_left(ch['pos'],start)
+        j=bisect_right(ch['pos'],end)
+        if ch['sequential']: # the lines of the region follow each other in the file
+            lines=islice(_iterLines(file,ch['offset'][i],None),j-i) if i<j else iter([])
+        else:
+            lines=_seekLines(file,ch['offset'][i:j])
+    found=False
+    try:
+        for content in lines:
+            val=content.split(b'\t',2)
+            if val[0].decode('utf-8')!=chrom:
+                if found:
+                    break
+                continue
+            found=True
+            pos=int(val[1])
+            if pos<start:
+                continue
+            if pos>end:
+                break
+            content=content.decode('utf-8')
+            if compact:
+                yield _lineToRecord(content,header)
+            else:
+                yield _lineToDict(content,header.fields)
+    finally:
+        if hasattr(lines,'close'):
+            lines.close()
+
+# Generator that yields the lines found at the byte 'offsets' of the file
+def _seekLines(file, offsets):
+    with open(file,'rb') as fi:
+        for offset in offsets:
+            fi.seek(offset)
+            yield fi.readline()
+
+###############################################################################
+###                 position index of (uncompressed) files                  ###
+###############################################################################
+''' Function buildPosIndex
+    input:  file, the name of an uncompressed VCF file
+    output: the index, a dictionary with keys 'size', 'mtime', 'chroms'
+
+    Reads the data section of the file once and keeps, for every CHROM, the
+    POS of all its data lines sorted, together with the byte offset of each
+    line, in compact arrays:
+        index['chroms'][chrom]['pos']         the sorted POS values (array of int64)
+        index['chroms'][chrom]['offset']      the byte offset of each of these lines (array of int64)
+        index['chroms'][chrom]['sequential']  True if the lines of the CHROM follow each other
+                                              in the file, sorted by POS
+        index['chroms'][chrom]['range']       (start, end) byte range of the lines of the CHROM
+                                              (if 'sequential'), so each CHROM can be processed
+                                              separately, e.g. by different processes
+    The index is saved next to the file (file name + '.vpi') together with the
+    size and the modification time of the file, and it is used by 'query' to seek
+    straight to the first line of a region and stop after the last one.
+'''
+def buildPosIndex(file):
+    header=readHeader(file)
+    st=os.stat(file)
+    chroms={}
+    if header.dataoffset>=0:
+        last=None  # the CHROM of the previous line
+        offset=header.dataoffset
+        with open(file,'rb') as fi:
+            fi.seek(offset)
+            for content in fi:
+                val=content.split(b'\t',2)
+                if val[0]!=last:
+                    if last is not None:
+                        chroms[last]['range'][1]=offset
+                    last=val[0]
+                    ch=chroms.get(last)
+                    if ch is None:
+                        ch={'pos':array('q'), 'offset':array('q'), 'sequential':True, 'range':[offset,offset]}
+                        chroms[last]=ch
+                    else: # the CHROM was found before, in another part of the file
+                        ch['sequential']=False
+                    pos=ch['pos']
+                    offsets=ch['offset']
+                p=int(val[1])
+                if len(pos)>0 and p<pos[-1]:
+                    ch['sequential']=False
+                pos.append(p)
+                offsets.append(offset)
+                offset+=len(content)
+        if last is not None:
+            chroms[last]['range'][1]=offset
+    index={'size':st.st_size, 'mtime':st.st_mtime_ns, 'chroms':{}}
+    for chrom,ch in chroms.items():
+        if not ch['sequential']: # sort the lines by POS (keeping the file order for equal POS)
+            order=sorted(range(len(ch['pos'])),key=ch['pos'].__getitem__)
+            ch['pos']=array('q',[ch['pos'][k] for k in order])
+            ch['offset']=array('q',[ch['offset'][k] for k in order])
+        ch['range']=tuple(ch['range'])
+        index['chroms'][chrom.decode('utf-8')]=ch
+    _savePosIndex(file,index)
+    _posindexes[file]=index
+    return index
+
+# Function that saves the position index: a first line with the index (in json) without the
+# arrays and then the bytes of the 'pos' and 'offset' arrays of each CHROM
+def _savePosIndex(file, index):
+    head={'size':index['size'], 'mtime':index['mtime'], 'byteorder':sys.byteorder, 'chroms':[]}
+    for chrom,ch in index['chroms'].items():
+        head['chroms'].append([chrom,len(ch['pos']),ch['sequential'],list(ch['range'])])
+    try:
+        with open(file+pos_index_ext,'wb') as fo:
+            fo.write((json.dumps(head)+'\n').encode('utf-8'))
+            for ch in index['chroms'].values():
+                ch['pos'].tofile(fo)
+                ch['offset'].tofile(fo)
+    except OSError:
+        print("Index file '{}' could not be written.".format(file+pos_index_ext))
+
+''' Function loadPosIndex
+    input:  file, the name of an uncompressed VCF file
+    output: the index (see 'buildPosIndex')
+
+    Returns the position index of the file, loading it from the '.vpi' file if it
+    is still valid (same size and modification time), else building it again.
+'''
+def loadPosIndex(file):
+    st=os.stat(file)
+    index=_posindexes.get(file)
+    if index is None and os.path.isfile(file+pos_index_ext):
+        try:
+            with open(file+pos_index_ext,'rb') as fi:
+                head=json.loads(fi.readline().decode('utf-8'))
+                index={'size':head['size'], 'mtime':head['mtime'], 'chroms':{}}
+                for chrom,count,sequential,rng in head['chroms']:
+                    ch={'pos':array('q'), 'offset':array('q'), 'sequential':sequential, 'range':tuple(rng)}
+                    ch['pos'].fromfile(fi,count)
+                    ch['offset'].fromfile(fi,count)
+                    if head['byteorder']!=sys.byteorder:
+                        ch['pos'].byteswap()
+                        ch['offset'].byteswap()
+                    index['chroms'][chrom]=ch
+        except (OSError, ValueError, EOFError):
+            index=None
+    if index is None or index['size']!=st.st_size or index['mtime']!=st.st_mtime_ns:
+        return buildPosIndex(file)
+    _posindexes[file]=index
+    return index
+
+###############################################################################
+###                    parallel reading by byte ranges                      ###
+###############################################################################
+''' Function iterBatches
+    input:  file, the name of a file to read the data from
+            workers, the number of processes that parse the file (default: the number of CPUs)
+            compact, if True VCFRecords are yielded instead of dictionaries (default True)
+            chunkbytes, the (approximate) size in bytes of the data lines of each batch
+            where, a filter expression (see 'compileFilter'); only the lines that pass it are kept
+    output: a generator that yields lists (batches) of data lines, in file order
+
+    The data section of the file is split in byte ranges of about 'chunkbytes'
+    bytes that start and end at line boundaries. The ranges are parsed by a pool
+    of 'workers' processes and the batches are yielded in the order of the file,
+    so the result is the same as reading the file with 'iterRecords'.
+    Compressed files can not be split, so they are read by the calling process.
+    On Windows, call it under "if __name__=='__main__':" in scripts.
+    *************************** example ****************************
+    for batch in vcf.iterBatches('cohort_225.vcf', workers=8):
+        for rec in batch:
+            if rec.FILTER=='PASS':
+                print(rec.CHROM,rec.POS)
+'''
+def iterBatches(file, workers=None, compact=True, chunkbytes=16*1024*1024, where=None):
+    header=readHeader(file)
+    if header.dataoffset<0:
+        return
+    if workers is None:
+        workers=os.cpu_count()
+    where=compileFilter(where)
+    if _isGzip(file):
+        batch=[]
+        size=0
+        for content in _iterLines(file,header.dataoffset,None):
+            size+=len(content)
+            content=content.decode('utf-8')
+            if where is None or where.match(content):
+                batch.append(_parseLine(content,header.fields,compact))
+            if size>=chunkbytes:
+                yield _wrapBatch(batch,header,compact)
+                batch=[]
+                size=0
+        if len(batch)>0:
+            yield _wrapBatch(batch,header,compact)
+        return
+    parts=max(1,(os.path.getsize(file)-header.dataoffset)//chunkbytes)
+    tasks=[(file,start,end,header.fields,compact,where) for start,end in _byteRanges(file,header.dataoffset,parts)]
+    if workers<=1:
+        for task in tasks:
+            yield _wrapBatch(_parseRange(task),header,compact)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for batch in pool.imap(_parseRange,tasks):
+            yield _wrapBatch(batch,header,compact)
+
+''' Function mapLines
+    input:  file, the name of a file to read the data from
+            func, a function func(lines, arg) called with lists of data lines (text,
+                  with their line end) and returning anything (e.g. the changed lines)
+            arg, the second argument given to 'func' (default None)
+            workers, the number of processes that run 'func' (default: the number of CPUs)
+            chunkbytes, the (approximate) size in bytes of the lines of each call
+    output: a generator that yields the results of 'func', in file order
+
+    Like 'iterBatches', but the work done on the lines runs in the processes too,
+    so it is meant for whole-file passes that transform every line. 'func' must be
+    defined at the top level of a module, so that it can be sent to the processes.
+    Compressed files are read by the calling process and their lines are sent to
+    the pool in chunks, at most workers*2 chunks ahead of the yielded results. On Windows, call it under "if __name__=='__main__':" in scripts.
+    *************************** example ****************************
+    def countPass(lines, arg):
+        return sum(1 for line in lines if line.split('\t',7)[6]=='PASS')
+    passed = sum(vcf.mapLines('cohort_225.vcf', countPass, workers=8))
+'''
+def mapLines(file, func, arg=None, workers=None, chunkbytes=16*1024*1024):
+    header=readHeader(file)
+    if header.dataoffset<0:
+        return
+    if workers is None:
+        workers=os.cpu_count()
+    if _isGzip(file):
+        tasks=((lines,None,None,func,arg) for lines in _iterChunks(file,header.dataoffset,chunkbytes))
+    else:
+        parts=max(1,(os.path.getsize(file)-header.dataoffset)//chunkbytes)
+        tasks=[(file,start,end,func,arg) for start,end in _byteRanges(file,header.dataoffset,parts)]
+    if workers<=1:
+        for task in tasks:
+            yield _mapRange(task)
+        return
+    # at most workers*2 chunks are read ahead of the results (the chunks of compressed files are
+    # decompressed here, so they must not be read all at once)
+    with multiprocessing.Pool(workers) as pool:
+        for result in imapBounded(pool,_mapRange,tasks,workers*2):
+            yield result
+
+''' Function imapBounded
+    input:  pool, a multiprocessing pool
+            func, the function run by the pool with each task
+            tasks, an iterable (e.g. a generator) of the arguments of func
+            window, the maximum number of tasks submitted whose results are not yet yielded
+    output: a generator that yields the results of func, in the order of the tasks
+
+    Like pool.imap, but 'tasks' is read only 'window' tasks ahead of the results
+    that are taken, while pool.imap reads all of it at once. So a generator of
+    big tasks (e.g. chunks of lines read from a file) is never kept in memory
+    as a whole, even when the results are written slower than they are made.
+    *************************** example ****************************
+    with multiprocessing.Pool(4) as pool:
+        for result in vcf.imapBounded(pool, func, chunks, 8):
+            fout.write(result)
+'''
+def imapBounded(pool, func, tasks, window):
+    pending=deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func,(task,)))
+        if len(pending)>=window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+# Function that calls the function of 'mapLines' with the lines of a byte range of a file
+# (or with the given list of lines, for compressed files)
+def _mapRange(args):
+    source,start,end,func,arg=args
+    if isinstance(source,list):
+        return func(source,arg)
+    return func([content.decode('utf-8') for content in _iterLines(source,start,end)],arg)
+
+# Generator that yields the lines (text) of the file from byte 'start' in lists of about 'chunkbytes' bytes
+def _iterChunks(file, start, chunkbytes):
+    lines=[]
+    size=0
+    for content in _iterLines(file,start,None):
+        size+=len(content)
+        lines.append(content.decode('utf-8'))
+        if size>=chunkbytes:
+            yield lines
+            lines=[]
+            size=0
+    if len(lines)>0:
+        yield lines
+
+# Function that splits the part of the file from byte 'start' to its end in 'parts'
+# ranges (start,end) of about equal size, each one starting at the start of a line
+def _byteRanges(file, start, parts):
+    size=os.path.getsize(file)
+    bounds=[start]
+    with open(file,'rb') as fi:
+        for i in range(1,parts):
+            p=start+(size-start)*i//parts
+            if p<=bounds[-1]:
+                continue
+            fi.seek(p-1)
+            fi.readline() # go to the start of the next line
+            p=fi.tell()
+            if bounds[-1]<p<size:
+                bounds.append(p)
+    bounds.append(size)
+    return list(zip(bounds[:-1],bounds[1:]))
+
+# Generator that yields the lines (bytes) of the file starting between the byte offsets
+# 'start' and 'end' (end=None for the end of the file)
+def _iterLines(file, start, end):
+    with _open(file) as fi:
+        fi.seek(start)
+        if end is None:
+            for content in fi:
+                yield content
+        else:
+            pos=start
+            for content in fi:
+                yield content
+                pos+=len(content)
+                if pos>=end:
+                    break
+
+# Function that parses the data lines of a byte range, run by the processes of 'iterBatches'.
+# The records are returned as split lines and turned into VCFRecords by '_wrapBatch'
+def _parseRange(args):
+    file,start,end,fields,compact,where=args
+    batch=[]
+    for content in _iterLines(file,start,end):
+        content=content.decode('utf-8')
+        if where is None or where.match(content):
+            batch.append(_parseLine(content,fields,compact))
+    return batch
+
+# Function that parses a data line to a dictionary, or to the values of a VCFRecord
+def _parseLine(content, fields, compact):
+    if compact:
+        return content.rstrip('\r\n').split('\t',9)
+    return _lineToDict(content,fields)
+
+# Function that turns the parsed lines of a batch into VCFRecords (if compact)
+def _wrapBatch(batch, header, compact):
+    if compact:
+        return [VCFRecord(header,val) for val in batch]
+    return batch
+
+###############################################################################
+###                             VCFWriter                                   ###
+###############################################################################
+''' Class VCFWriter
+    Writes a VCF file: the header (from a VCFHeader) and then the data lines.
+        writer = vcf.VCFWriter('some_file_name.vcf', header, compress=False, bufsize=4*1024*1024, level=6)
+        writer.write(rec)          writes a data line: a VCFRecord, a dictionary (as returned
+                                   by 'read') or a text line
+        writer.writeBatch(recs)    writes a list of data lines
+        writer.close()             writes what is left in the buffer and closes the file
+                                   (or use it in a 'with' statement)
+    The lines are gathered in memory and written 'bufsize' bytes at a time, so
+    the time is spent in large writes and not in one write per line.
+    The '##' lines of the header are written as they were read (see 'readHeader'),
+    so the meta, INFO, FILTER and FORMAT lines are kept as they are. A header made
+    by hand (without 'metalines') is written from its fileformat, meta, info, filt
+    and form. The '#CHROM' line is written from header.fields, so a header of a
+    sample subset (see the 'samples' argument of 'read') writes only these samples.
+    With compress=True the file is compressed with bgzip (BGZF), so it can be read
+    back by this module (and by tabix/bcftools) and queried with 'query'; 'level'
+    is the zlib compression level (1 is much faster, 9 gives the smallest file).
+    *************************** example ****************************
+    header = vcf.readHeader('cohort_225.vcf')
+    with vcf.VCFWriter('cohort_225_pass.vcf.gz', header, compress=True) as writer:
+        for batch in vcf.iterBatches('cohort_225.vcf', where='FILTER==PASS'):
+            writer.writeBatch(batch)
+'''
+class VCFWriter:
+    def __init__(self, file, header, compress=False, bufsize=4*1024*1024, level=6):
+        self.file=file
+        self.header=header
+        self.bufsize=bufsize
+        self.lines=0 # the number of data lines written
+        self._buffer=[]
+        self._size=0
+        fo=open(file,'wb')
+        self._fo=_BgzfWriter(fo,level) if compress else fo
+        self._write(formatHeader(header))
+        self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, rec):
+        self._write(_recordLine(rec,self.header))
+        self.lines+=1
+
+    def writeBatch(self, recs):
+        for rec in recs:
+            self._write(_recordLine(rec,self.header))
+        self.lines+=len(recs)
+
+    def close(self):
+        if self._fo is not None:
+            self._flush()
+            self._fo.close()
+            self._fo=None
+
+    def _write(self, text):
+        self._buffer.append(text)
+        self._size+=len(text)
+        if self._size>=self.bufsize:
+            self._flush()
+
+    def _flush(self):
+        if len(self._buffer)>0:
+            self._fo.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer=[]
+            self._size=0
+
+''' Function write
+    input:  file, the name of the file to write
+            header, a VCFHeader (e.g. from 'readHeader')
+            records, the data lines (VCFRecords, dictionaries or text lines), a list or a generator
+            compress, if True the file is compressed with bgzip (default False)
+            level, the compression level if compress=True (default 6)
+    output: the number of data lines written
+
+    The counterpart of 'read': writes the header and all the records with a VCFWriter.
+    *************************** example ****************************
+    header = vcf.readHeader('cohort_225.vcf')
+    vcf.write('chr05.vcf', header, vcf.query('cohort_225.vcf', 'Bgt_chr-05', 1, 10**9, compact=True))
+'''
+def write(file, header, records, compress=False, level=6):
+    with VCFWriter(file,header,compress,level=level) as writer:
+        for rec in records:
+            writer.write(rec)
+    return writer.lines
+
+''' Function formatHeader
+    input:  header, a VCFHeader
+    output: the text of the header (the '##' lines and the '#CHROM' line)
+'''
+def formatHeader(header):
+    lines=list(header.metalines)
+    if len(lines)==0: # a header made by hand, so make the '##' lines from its contents
+        if header.fileformat!="unknown":
+            lines.append("##fileformat="+header.fileformat+"\n")
+        for key,value in header.meta.items():
+            lines.append("##"+key+"="+value.rstrip('\n')+"\n")
+        for name,dicts in (('INFO',header.info),('FILTER',header.filt),('FORMAT',header.form)):
+            for dic in dicts:
+                if isinstance(dic,dict):
+                    lines.append("##"+name+"=<"+",".join(k+"="+v for k,v in dic.items())+">\n")
+    lines.append("#"+"\t".join(header.fields)+"\n")
+    return ''.join(lines)
+
+# Function that returns the text line of a data line given as VCFRecord, dictionary or text
+def _recordLine(rec, header):
+    if isinstance(rec,VCFRecord):
+        return rec.toLine()
+    if isinstance(rec,dict):
+        # sites-only files have 8 columns, without FORMAT and samples
+        val=[rec[header.fields[j]] for j in range(min(9,len(header.fields))) if header.fields[j] in rec]
+        val+=[rec["data"+str(i)] for i in range(1,rec.get("sample_size",0)+1)]
+        return '\t'.join(val)+'\n'
+    return rec if rec.endswith('\n') else rec+'\n'
+
+# Class that writes a BGZF (bgzip) file: the data are compressed in blocks of at most
+# 65280 bytes, each one a gzip member with the 'BC' extra sub-field, and an empty block at the end
+class _BgzfWriter:
+    def __init__(self, fo, level=6):
+        self.fo=fo
+        self.level=level
+        self.buf=bytearray()
+
+    def write(self, data):
+        self.buf+=data
+        start=0
+        while len(self.buf)-start>=bgzf_block_size:
+            self.fo.write(_bgzfBlock(bytes(self.buf[start:start+bgzf_block_size]),self.level))
+            start+=bgzf_block_size
+        del self.buf[:start]
+
+    def close(self):
+        if len(self.buf)>0:
+            self.fo.write(_bgzfBlock(bytes(self.buf),self.level))
+        self.fo.write(_bgzfBlock(b'',self.level)) # the end-of-file block
+        self.fo.close()
+
+# Function that compresses 'data' to a BGZF block
+def _bgzfBlock(data, level):
+    comp=zlib.compressobj(level,zlib.DEFLATED,-15)
+    cdata=comp.compress(data)+comp.flush()
+    head=struct.pack('<4BI2BH2BHH',31,139,8,4,0,0,255,6,66,67,2,len(cdata)+25)
+    return head+cdata+struct.pack('<II',zlib.crc32(data)&0xffffffff,len(data))